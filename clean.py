@@ -1,11 +1,12 @@
 from datetime import datetime
 import pandas as pd
-import spacy, logging, multiprocessing, sys, arrow, pycountry
+import spacy, logging, multiprocessing, sys, pycountry
 
 from utils.placenames import us_states, ca_prov, countries
 from utils.misc import Utils
 from more_itertools import unique_everseen
 from embed import EmbeddingTrainer
+from parsing.timestamps import to_epoch
 
 class AttributeCleaner:
     def __init__(self, tweet_frequency=800):
@@ -60,18 +61,14 @@ class AttributeCleaner:
         """Converts StockTwits UTC timestamp format to UNIX epoch.
 
         Examples:
-            >>> print(arrow.get('2017-02-01 19:16:54', 'YYYY-MM-DD HH:mm:ss').timestamp)
+            >>> print(to_epoch(['2017-02-01T19:16:54Z'])[0])
                 1485976614
 
         """
         
         logger = logging.getLogger()
-        self.df['item_timestamp'] = self.df['item_timestamp'].str.replace('T', ' ')
-        self.df['item_timestamp'] = self.df['item_timestamp'].str.replace('Z', '')
         logger.info('Starting formatted timestamp to UNIX timestamp conversion...')
-        for i, data in self.df.iterrows():
-            ts = arrow.get(data['item_timestamp'], 'YYYY-MM-DD HH:mm:ss').timestamp
-            self.df.at[i, 'item_timestamp'] = ts
+        self.df['item_timestamp'] = to_epoch(self.df['item_timestamp'])
         logger.info('UNIX timestamp conversion complete')
 
     def iterate_notokens(self, d):
@@ -4,13 +4,14 @@ import re, spacy, json, logging, multiprocessing, sys
 from datetime import datetime
 
 from utils.misc import Utils
+from parsing.dumps import open_dump
 
 class TaggedDocumentIterator(object):
     def __init__(self, trainables_file):
         self.tf = trainables_file
 
     def __iter__(self):
-        with open(self.tf) as f:
+        with open_dump(self.tf, text=True) as f:
             for line in f:
                 words, tags = line.split("\t")
                 yield TaggedDocument(words=words.split(","), tags=tags.split(","))
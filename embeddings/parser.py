@@ -4,7 +4,11 @@ from pathlib import Path
 from datetime import timedelta, datetime
 import time
 
+import os, sys
+
 from utils import lines_that_contain, check_file, date_prompt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsing'))
+from dumps import ArchiveIndex, DumpReader, dump_name, iter_keys
 
 import spacy, json, re, itertools, multiprocessing
 import more_itertools as mit
@@ -54,92 +58,61 @@ class Parser:
             return tokens
 
     def parse_file(self, filename):
-        with open(self.tweets_path+filename+".txt", 'w') as fp:
-            with open(self.dir+filename) as inputFile:
-                for line in inputFile:
-                    data = json.loads(line)
-                    user = data['data']['user']['username']
-                    tweet_id = data['data']['id']
-                    tweet_body = data['data']['body']
-                    tokens = self.tokenise(tweet_body)
-                    if tokens:
-                        entry = {'id':tweet_id, 'body':tweet_body, 'tokens':tokens}
-                        json.dump({user:entry}, fp)
-                        fp.write("\n")
+        with open(self.tweets_path+dump_name(filename)+".txt", 'w') as fp:
+            reader = DumpReader(['data.user.username', 'data.id', 'data.body'])
+            for user, tweet_id, tweet_body in reader.records(self.dir+filename):
+                tokens = self.tokenise(tweet_body)
+                if tokens:
+                    entry = {'id':tweet_id, 'body':tweet_body, 'tokens':tokens}
+                    json.dump({user:entry}, fp)
+                    fp.write("\n")
         
 
     def get_user_tweets(self, files):
         for filename in files:
-            if not exists(self.tweets_path+filename+'.txt'):
+            if not exists(self.tweets_path+dump_name(filename)+'.txt'):
                 self.parse_file(filename)
 
     """ The following functions are responsible for combining the files and their tweets.
 
     """
 
-    def write_users_file(self):
-        title = "WRITE USERS FILE"
-        store = [f for f in listdir(self.tweets_path) if isfile(join(self.tweets_path, f)) and "stocktwits_messages_" in f]
-        store.sort()
-        dates = []
+    def write_users_file(self, date_from=None, date_to=None):
+        files_selected = self.query_dates(date_from, date_to, title="WRITE USERS FILE")
+        users_file = self.path_data+'st_comb_'+ArchiveIndex.date(files_selected[0])+"-"+ArchiveIndex.date(files_selected[-1])+"_USERS.txt"
+        with open(users_file, 'w') as fp:
+            for f in files_selected:
+                print("Collecting users... Current file: {0}".format(f), end="\r")
+                for user in iter_keys(self.tweets_path+f):
+                    fp.write(user+"\n")
+        print("\nUsers written to file:", users_file)
+        print("Please use command (on Unix filesystems): 'sort -u -o "+users_file+" "+users_file+"' to get unique users")
 
-        for filename in store:
-            dates.append(filename[-14:-4])
-        
-        print("\n"+title+"\n"+("-"*len(title))+"\n"+"Data is available for the following dates:")
-        print("{}, {}".format(", ".join(dates[:-1]), dates[-1]))
-
-        date_from, date_to = None, None
-        while date_from == None and date_to == None:
-            try:
-                date_from, date_to = date_prompt(self, dates)
-            except TypeError: pass
-        
-        date_from_index, date_to_index = [i for i, s in enumerate(store) if date_from in s], [i for i, s in enumerate(store) if date_to in s]
-        if date_from_index != None and date_to_index != None:
-            files_selected = store[date_from_index[0]:date_to_index[0]+1]
-            users_file = self.path_data+'st_comb_'+files_selected[0][-14:-4]+"-"+files_selected[-1][-14:-4]+"_USERS.txt"
-            with open(users_file, 'w') as fp:
-                for f in files_selected:
-                    print("Collecting users... Current file: {0}".format(f), end="\r")
-                    with open(self.tweets_path+f) as inputFile:
-                        for line in inputFile:
-                            user = list(json.loads(line).keys())[0]
-                            fp.write(user+"\n")
-            print("\nUsers written to file:", users_file)
-            print("Please use command (on Unix filesystems): 'sort -u -o "+users_file+" "+users_file+"' to get unique users")
-
-    def query_dates(self):
-            store = [f for f in listdir(self.tweets_path) if isfile(join(self.tweets_path, f)) and "stocktwits_messages_" in f]
+    def query_dates(self, date_from=None, date_to=None, title=None):
+            """Selects the tweet files between two dates (YYYY_MM_DD), by the date in their names.
+
+            The dates are prompted for when not given.
+
+            """
+
+            store = [f for f in listdir(self.tweets_path) if isfile(join(self.tweets_path, f)) and "stocktwits_messages_" in f and ArchiveIndex.date(f)]
             store.sort()
-            
             if self.all:
                 return store
 
-            print("\n"+"Data is available for the following dates:")
-            dates = []
-            for filename in store:
-                dates.append(filename[-14:-4])
-            print("{}, {}".format(", ".join(dates[:-1]), dates[-1]))
-
-            date_from, date_to = None, None
+            dates = [ArchiveIndex.date(f) for f in store]
             while date_from == None and date_to == None:
+                print("\n"+(title+"\n"+("-"*len(title))+"\n" if title else "")+"Data is available for the following dates:")
+                print("{}, {}".format(", ".join(dates[:-1]), dates[-1]))
                 try:
                     date_from, date_to = date_prompt(self, dates)
                 except TypeError: pass
-            
-            date_from_index, date_to_index = [i for i, s in enumerate(store) if date_from in s], [i for i, s in enumerate(store) if date_to in s]
-            if date_from_index != None and date_to_index != None:
-                files_selected = store[date_from_index[0]:date_to_index[0]+1]
-            return files_selected
+
+            return [f for f in store if date_from <= ArchiveIndex.date(f) <= date_to]
 
     def convert_to_trainable(self):
-        if self.all:
-            files = [f for f in listdir(self.tweets_path) if isfile(join(self.tweets_path, f)) and "stocktwits_messages_" in f]
-            files.sort()
-        else:
-            files = self.query_dates()
-        date_from, date_to = files[0][-14:-4], files[len(files)-1][-14:-4]
+        files = self.query_dates()
+        date_from, date_to = ArchiveIndex.date(files[0]), ArchiveIndex.date(files[len(files)-1])
         file_to_write = "trainable_"+date_from+"-"+date_to+".txt"
 
         print("Writing trainable file ("+date_from+" to "+date_to+") at:", str(datetime.now()))
@@ -1,7 +1,6 @@
 from os.path import join
 from os import environ
 
-from sklearn.datasets import load_svmlight_file
 from sklearn.metrics import roc_auc_score, mean_squared_error
 
 from fastFM import als
@@ -14,14 +13,18 @@ import tensorflow as tf
 
 import scipy
 import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsing'))
+from libfm import load_libfm
 
 class FactorisationMachines:
     def __init__(self, onlyResults=False, metric='rmse'):
         self._data_path = './data/libsvm/'
         self._libfm_path = './models/fm/libfm/'
         self._xlearn_path = './models/fm/xlearn/'
-        self.X_train, self.y_train = load_svmlight_file(join(self._data_path,'train.libfm'))
-        self.X_test, self.y_test = load_svmlight_file(join(self._data_path,'test.libfm'))
+        self.X_train, self.y_train = load_libfm(join(self._data_path,'train.libfm'))
+        self.X_test, self.y_test = load_libfm(join(self._data_path,'test.libfm'))
 
         self.onlyResults = onlyResults
         self.metric = metric
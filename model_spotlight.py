@@ -11,6 +11,7 @@ models, namely:
 import hashlib
 import logging
 import sys
+import os
 import json
 
 from datetime import datetime
@@ -27,6 +28,9 @@ from spotlight.sequence.representations import CNNNet
 from spotlight.cross_validation import random_train_test_split
 from spotlight.evaluation import precision_recall_score, mrr_score, sequence_precision_recall_score, sequence_mrr_score
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsing'))
+from store import InteractionStore
+
 NUM_SAMPLES = 100
 DEFAULT_PARAMS = {
     'learning_rate': 0.01,
@@ -146,7 +150,7 @@ class SpotlightModel:
 
     def __init__(self):
         self._logpath = './models/logs/sequence/'
-        self._rpath = './data/csv/dataparser/data.csv'
+        self._rpath = './data/csv/dataparser/data'
         self._models = 'S_LSTM'
 
     def logger(self):
@@ -169,7 +173,9 @@ class SpotlightModel:
             ])
 
     def csv_to_df(self, months: int) -> tuple:
-        """Reads in CSV file, converts it to a number of Pandas DataFrames.
+        """Reads in the interaction store, converts it to a number of Pandas DataFrames.
+
+        Only the user, cashtag and timestamp columns are read, the cashtag attributes are never touched.
 
         Returns:
             tuple: Returns tuple of Pandas DataFrames; user features, item features and
@@ -177,7 +183,7 @@ class SpotlightModel:
 
         """
 
-        df = pd.read_csv(self._rpath, sep='\t')
+        df = InteractionStore(self._rpath).read(columns=['user_id', 'tag_id', 'timestamp'], mmap=False)
         
         df = df.rename(
             columns={
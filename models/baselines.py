@@ -27,13 +27,16 @@ import os
 
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsing'))
+from store import InteractionStore
+
 RANDOM_STATE = np.random.RandomState(100)
 
 class BaselineModels:
     def __init__(self):
         self.logpath = 'logs/baselines/'
         # self.rpath = './data/csv/cashtags_clean.csv'
-        self.rpath = '../data/csv/dataparser/data.csv'
+        self.rpath = '../data/csv/dataparser/data'
         self.df = self.csv_to_df()
 
     def logger(self, model_name):
@@ -56,7 +59,7 @@ class BaselineModels:
                 ])
 
     def csv_to_df(self) -> tuple:
-        """Reads in CSV file, converts it to a number of Pandas DataFrames.
+        """Reads in the interaction store, converts it to a number of Pandas DataFrames.
 
         Returns:
             tuple: Returns tuple of Pandas DataFrames; user features, item features and
@@ -64,7 +67,7 @@ class BaselineModels:
 
         """
 
-        df = pd.read_csv(self.rpath, sep='\t')
+        df = InteractionStore(self.rpath).read(mmap=False)
         df_symbol_features = df[['user_id', 'tag_id', 'tag_industry', 'tag_sector']]
         df['count'] = df.groupby(['user_id', 'tag_id']).user_id.transform('size')
         df_weights = df[['user_id', 'tag_id', 'count']].drop_duplicates(
@@ -1,4 +1,3 @@
-from sklearn.datasets import load_svmlight_file
 from sklearn.metrics import mean_squared_error, precision_score, recall_score, roc_auc_score
 from os.path import join
 
@@ -22,13 +21,16 @@ import tensorflow as tf
 
 import scipy
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsing'))
+from libfm import load_libfm
+
 class FactorisationMachines:
     def __init__(self):
         self.dpath = '../data/csv/dataparser/'
         # self.dpath = '../data/libsvm/old/'
         self.logpath = 'logs/fm/'
-        self.X_train, self.y_train = load_svmlight_file(join(self.dpath, 'train.libfm'))
-        self.X_test, self.y_test = load_svmlight_file(join(self.dpath, 'test.libfm'))
+        self.X_train, self.y_train = load_libfm(join(self.dpath, 'train.libfm'))
+        self.X_test, self.y_test = load_libfm(join(self.dpath, 'test.libfm'))
 
     def logger(self, model_name):
         """Sets the logger configuration to report to both std.out and to log to ./log/models/<MODEL_NAME>/
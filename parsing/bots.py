@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+STAT_COLUMNS = ['messages', 'cashtags', 'peak_per_minute', 'first_ts', 'last_ts', 'gaps', 'gap_sum', 'gap_sumsq']
+
+class BotScorer:
+    """Streaming, per-user activity statistics for flagging automated accounts.
+
+    Batches of messages (eg. one daily dump) are summarised into a handful of numbers per
+    user and merged into the running statistics, so each message is looked at once and
+    memory grows only with the number of users:
+        messages, cashtags: Number of messages and cashtags posted.
+        peak_per_minute: Highest number of messages posted within a single minute.
+        first_ts, last_ts: Timestamps of the first and last message seen.
+        gaps, gap_sum, gap_sumsq: Count, sum and sum of squares of the inter-arrival times,
+            from which the regularity (coefficient of variation) of posting is derived.
+
+    A user is flagged when any of the configured thresholds is exceeded.
+
+    Attributes:
+        max_per_minute (int): Flag users posting more messages than this in one minute.
+        max_cashtags_per_message (float): Flag users averaging more distinct cashtags per message.
+        min_gap_cv (float): Flag users whose inter-arrival coefficient of variation is below this,
+            ie. who post at clockwork intervals.
+        min_messages (int): Minimum number of messages before the regularity test applies.
+
+    """
+
+    def __init__(self, max_per_minute: int=10, max_cashtags_per_message: float=5.0, min_gap_cv: float=0.1, min_messages: int=100):
+        self.max_per_minute = max_per_minute
+        self.max_cashtags_per_message = max_cashtags_per_message
+        self.min_gap_cv = min_gap_cv
+        self.min_messages = min_messages
+        self.clear()
+
+    def clear(self):
+        self.stats = pd.DataFrame(columns=STAT_COLUMNS, dtype=np.int64).rename_axis('user_id')
+
+    @staticmethod
+    def summarise(user_ids, timestamps, n_cashtags) -> pd.DataFrame:
+        """Summarises a batch of messages into per-user statistics.
+
+        Args:
+            user_ids (array-like): User id per message.
+            timestamps (array-like): UNIX timestamp per message.
+            n_cashtags (array-like): Number of distinct cashtags per message.
+
+        Returns:
+            pandas.DataFrame: STAT_COLUMNS indexed by user_id.
+
+        """
+
+        df = pd.DataFrame({
+            'user_id': np.asarray(user_ids, dtype=np.int64),
+            'ts': np.asarray(timestamps, dtype=np.int64),
+            'cashtags': np.asarray(n_cashtags, dtype=np.int64)
+        }).sort_values(['user_id', 'ts'], kind='mergesort')
+
+        gap = df['ts'].diff()
+        gap = gap.where(df['user_id'].eq(df['user_id'].shift()))
+        df['gap'], df['gap_sq'] = gap, gap**2
+        df['minute'] = df['ts'] // 60
+
+        users = df.groupby('user_id')
+        summary = pd.DataFrame({
+            'messages': users.size(),
+            'cashtags': users['cashtags'].sum(),
+            'peak_per_minute': df.groupby(['user_id', 'minute']).size().groupby(level='user_id').max(),
+            'first_ts': users['ts'].min(),
+            'last_ts': users['ts'].max(),
+            'gaps': users['gap'].count(),
+            'gap_sum': users['gap'].sum(),
+            'gap_sumsq': users['gap_sq'].sum()
+        })
+        return summary.astype(np.int64)[STAT_COLUMNS]
+
+    def merge(self, summary):
+        """Merges the summary of a later batch into the running statistics.
+
+        The gap between a user's last message of the running statistics and their first
+        message of the new batch is counted as one more inter-arrival time.
+
+        """
+
+        both = self.stats.index.intersection(summary.index)
+        a, b = self.stats.loc[both], summary.loc[both]
+        boundary = (b['first_ts']-a['last_ts']).abs()
+
+        merged = pd.DataFrame({
+            'messages': a['messages']+b['messages'],
+            'cashtags': a['cashtags']+b['cashtags'],
+            'peak_per_minute': np.maximum(a['peak_per_minute'], b['peak_per_minute']),
+            'first_ts': np.minimum(a['first_ts'], b['first_ts']),
+            'last_ts': np.maximum(a['last_ts'], b['last_ts']),
+            'gaps': a['gaps']+b['gaps']+1,
+            'gap_sum': a['gap_sum']+b['gap_sum']+boundary,
+            'gap_sumsq': a['gap_sumsq']+b['gap_sumsq']+boundary**2
+        })
+        self.stats = pd.concat([
+            self.stats.drop(both),
+            summary.drop(both),
+            merged
+        ]).astype(np.int64)
+
+    def rebuild(self, summaries):
+        """Rebuilds the running statistics from batch summaries, merged in the given order.
+
+        Rebuilding from the summary of every batch, in time order, rather than merging a
+        replaced batch on top of the saved statistics, means no batch is counted twice and
+        the boundary gaps are those between consecutive batches.
+
+        Returns:
+            BotScorer: self, for chaining.
+
+        """
+
+        self.clear()
+        for summary in summaries:
+            self.merge(summary)
+        return self
+
+    def update(self, user_ids, timestamps, n_cashtags):
+        self.merge(self.summarise(user_ids, timestamps, n_cashtags))
+
+    def scores(self) -> pd.DataFrame:
+        """Derives the per-user activity rates and bot flags from the running statistics.
+
+        """
+
+        stats = self.stats
+        gap_mean = stats['gap_sum'] / stats['gaps'].replace(0, np.nan)
+        gap_var = (stats['gap_sumsq'] / stats['gaps'].replace(0, np.nan) - gap_mean**2).clip(lower=0)
+        scores = pd.DataFrame({
+            'messages': stats['messages'],
+            'peak_per_minute': stats['peak_per_minute'],
+            'cashtags_per_message': stats['cashtags'] / stats['messages'],
+            'gap_cv': np.sqrt(gap_var) / gap_mean.replace(0, np.nan)
+        })
+        scores['bot'] = (
+            (scores['peak_per_minute'] > self.max_per_minute) |
+            (scores['cashtags_per_message'] > self.max_cashtags_per_message) |
+            ((scores['messages'] >= self.min_messages) & (scores['gap_cv'] < self.min_gap_cv))
+        )
+        return scores
+
+    def flagged(self) -> np.ndarray:
+        scores = self.scores()
+        return scores.index[scores['bot']].values
+
+    def save(self, path):
+        self.stats.to_csv(path, sep='\t')
+
+    def load(self, path):
+        """Loads previously saved statistics, if any, so that ingestion can continue from them.
+
+        Returns:
+            BotScorer: self, for chaining.
+
+        """
+
+        try:
+            self.stats = pd.read_csv(path, sep='\t', index_col='user_id').astype(np.int64)[STAT_COLUMNS]
+        except FileNotFoundError:
+            pass
+        return self
@@ -1,18 +1,37 @@
 from datetime import datetime
 from sklearn.utils import shuffle
-from sklearn.datasets import dump_svmlight_file
-from sklearn.model_selection import train_test_split
 
 import numpy as np
 import pandas as pd
 
-import scipy
+import scipy.sparse
+import multiprocessing
 import os
 import logging
 import sys
-import json
-import re
-import time
+
+from store import InteractionStore, Manifest
+from timestamps import to_epoch
+from dumps import ArchiveIndex, DumpReader, dump_name
+from filters import MaskPipeline, k_core
+from bots import BotScorer
+from sampling import NegativeSampler
+from encoders import HashingEncoder, OneHotEncoder
+from libfm import dump_libfm
+from splits import Splitter
+
+SYMBOL_FIELDS = [
+    'data.user.id',
+    'data.created_at',
+    'data.symbols[*].id',
+    'data.symbols[*].industry',
+    'data.symbols[*].sector'
+]
+HISTORY_FEATURES = {
+    'user_tags': 'tag_id',
+    'user_sectors': 'tag_sector',
+    'user_industries': 'tag_industry'
+}
 
 class DataPrep:
     def __init__(self, name):
@@ -40,52 +59,117 @@ class DataPrep:
             logging.root.removeHandler(handler)
 
 class DataParser(DataPrep):
-    def __init__(self, limit: str=None):
+    def __init__(self, limit: str=None, workers: int=None, incremental: bool=False, window: tuple=None, bots: BotScorer=None):
         super().__init__('data_parser')
-
-        self.files = [f for f in os.listdir(self.st_path) if os.path.isfile(os.path.join(self.st_path, f))]
+        self.shard_path = os.path.join(self.dpath, 'shards')
+        self.bot_path = os.path.join(self.dpath, 'bot_stats.csv')
+        self.bots = bots or BotScorer()
+        self.workers = workers or multiprocessing.cpu_count()
+        self.incremental = incremental
+        self.window = window
+        self.store = InteractionStore(os.path.join(self.dpath, 'symbols'))
+        self.manifest = Manifest(self.store)
+
+        self.files = [f for f in os.listdir(self.st_path) if not f.startswith('.') and ArchiveIndex.date(f) and os.path.isfile(os.path.join(self.st_path, f))]
         self.files.sort()
         if limit:
-            self.files = self.files[:next(self.files.index(x) for x in self.files if x.endswith(limit))]
+            self.files = [f for f in self.files if ArchiveIndex.date(f) < limit]
+        # the date index is only needed, and only built for the dumps, a window applies to
+        self.index = None
+        if window:
+            date_from, date_to = ArchiveIndex.window_dates(*window)
+            self.files = [f for f in self.files if date_from <= ArchiveIndex.date(f) <= date_to]
+            self.index = ArchiveIndex(self.st_path, path=os.path.join(self.dpath, 'archive_index.json')).build(self.files)
+
+    def summary_path(self, fp) -> str:
+        return os.path.join(self.shard_path, dump_name(fp)+'.bots.csv')
+
+    def parse_file(self, fp) -> str:
+        """Parses the symbols of a single daily dump and writes them to their own shard.
+
+        Runs inside a worker process, so only the rows of one file are ever held in memory.
+        The per-user activity summary of the file is written next to the shard for bot scoring,
+        it covers every message of the file, including those without cashtags.
+
+        Returns:
+            str: Path to the written shard.
+
+        """
 
-    def get_symbols_only(self):
-        logger = logging.getLogger()
         rows = []
+        messages = []
+        reader = DumpReader(SYMBOL_FIELDS)
+        if self.window:
+            records = reader.decode(self.index.window(*self.window, files=[fp]))
+        else:
+            records = reader.records(os.path.join(self.st_path, fp))
+        for user_id, timestamp, s_ids, s_industries, s_sectors in records:
+            if user_id is None or timestamp is None:
+                continue
+            messages.append((user_id, timestamp, len(set(s_ids))))
+            for check in zip(s_ids, s_industries, s_sectors):
+                if not all(check):
+                    continue
 
-        for i, fp in enumerate(self.files):
-            logger.info("Parsing file <{}>, {}/{}".format(fp, i+1, len(self.files)))
-            with open(os.path.join(self.st_path, fp)) as f:
-                for line in f:
-                    data = json.loads(line)['data']
-                    symbols = data.get('symbols')
-                    if not symbols:
-                        continue
-
-                    for s in symbols:
-                        check = (s_id, s_industry, s_sector) = s.get('id'), s.get('industry'), s.get('sector')
-                        if not all(check):
-                            continue
-
-
-                        s_industry = re.sub('[^\w]+', '', s_industry)
-                        s_sector = re.sub('[^\w]+', '', s_sector)
-
-                        timestamp = data.get('created_at')
-                        timestamp = re.sub('T|Z', ' ', timestamp).strip()
-                        timestamp = int(time.mktime(time.strptime(timestamp,'%Y-%m-%d %H:%M:%S')))
-                        
-                        rows.append({
-                            'user_id': data['user']['id'],
-                            'tag_id': s_id,
-                            'timestamp': timestamp,
-                            'tag_industry': s_industry,
-                            'tag_sector': s_sector
-                        })
+                s_id, s_industry, s_sector = check
+                rows.append((user_id, s_id, timestamp, s_industry, s_sector))
 
         df = pd.DataFrame(rows, columns=['user_id', 'tag_id', 'timestamp','tag_industry', 'tag_sector'])
-        
-        outpath = os.path.join(self.dpath, '01_symbols.csv')
+        df['timestamp'] = to_epoch(df['timestamp'])
+        df['tag_industry'] = df['tag_industry'].str.replace(r'[^\w]+', '', regex=True)
+        df['tag_sector'] = df['tag_sector'].str.replace(r'[^\w]+', '', regex=True)
+
+        outpath = os.path.join(self.shard_path, dump_name(fp)+'.csv')
         df.to_csv(outpath, sep='\t', index=False)
+
+        user_ids, timestamps, n_cashtags = zip(*messages) if messages else ((), (), ())
+        BotScorer.summarise(user_ids, to_epoch(timestamps), n_cashtags).to_csv(self.summary_path(fp), sep='\t')
+        return outpath
+
+    def merge_shards(self, files, shards):
+        """Appends the per-file shards, in file order, to the symbols interaction store.
+
+        The bot statistics are rebuilt from the activity summaries of every file in the
+        manifest and of the new shards, in date order. Every interaction is kept in the store,
+        flagged users are only left out when the store is read by DataCleaner.bot_cleaner, so
+        a flag cleared by later data takes effect without re-parsing. Each file is recorded in
+        the store's manifest along with the rows it produced and its summary.
+
+        """
+
+        logger = logging.getLogger()
+        summaries = {fp: e.get('bots') or self.summary_path(fp) for fp, e in self.manifest.files.items()}
+        summaries.update({fp: self.summary_path(fp) for fp in files})
+        self.bots.rebuild(pd.read_csv(summaries[fp], sep='\t', index_col='user_id') for fp in sorted(summaries, key=ArchiveIndex.date))
+        self.bots.save(self.bot_path)
+        logger.info("Flagged {} of {} users as bots".format(len(self.bots.flagged()), self.bots.stats.shape[0]))
+
+        for fp, shard in zip(files, shards):
+            rows = self.store.append(pd.read_csv(shard, sep='\t'))
+            self.manifest.add(fp, os.path.join(self.st_path, fp), rows, summaries[fp])
+        logger.info("Merged {} shards into <{}>, {} interactions".format(len(shards), self.store.path, self.store.rows))
+
+    def get_symbols_only(self):
+        logger = logging.getLogger()
+        os.makedirs(self.shard_path, exist_ok=True)
+
+        if self.incremental:
+            files = self.manifest.pending(self.st_path, self.files)
+            logger.info("Incremental ingestion, {} of {} files are new or changed".format(len(files), len(self.files)))
+            for fp in files:
+                self.manifest.remove(fp)
+        else:
+            files = self.files
+            self.store.clear()
+            self.manifest.clear()
+
+        shards = []
+        with multiprocessing.Pool(processes=self.workers) as pool:
+            for i, shard in enumerate(pool.imap(self.parse_file, files)):
+                logger.info("Parsed file <{}>, {}/{}".format(files[i], i+1, len(files)))
+                shards.append(shard)
+
+        self.merge_shards(files, shards)
             
     def run(self):
         self.logger()
@@ -93,9 +177,11 @@ class DataParser(DataPrep):
         self.clear_logger_settings()
 
 class DataCleaner(DataPrep):
-    def __init__(self, fp):
+    def __init__(self, name, bots: BotScorer=None):
         super().__init__('data_cleaner')
-        self.df = pd.read_csv(os.path.join(self.dpath, fp), sep='\t')
+        self.bots = (bots or BotScorer()).load(os.path.join(self.dpath, 'bot_stats.csv'))
+        self.df = InteractionStore(os.path.join(self.dpath, name)).read()
+        self.store = InteractionStore(os.path.join(self.dpath, 'data'))
 
     # def format_data(self):
     #     logger = logging.getLogger()
@@ -121,159 +207,121 @@ class DataCleaner(DataPrep):
     #     self.df.to_csv(outpath, sep='\t', index=False)
     #     sys.exit(0)
 
-    def bot_cleaner(self):
+    def bot_cleaner(self, mask) -> np.ndarray:
         logger = logging.getLogger()
-        bot_ids = [47688, 2843, 74023, 356080, 348830, 373849, 406225, 730219, 894342, 347689]
+        bot_ids = self.bots.flagged()
+        logger.info("Begin bot removal... {} flagged users".format(len(bot_ids)))
+        return ~self.df.user_id.isin(bot_ids).values
 
-        data_count = self.df.shape[0]
-        logger.info("Begin bot removal... Dataframe Size: {}".format(data_count))
-        self.df = self.df[~self.df.user_id.isin(bot_ids)]
-        logger.info("Removed bots. Size of DataFrame: {0} -> {1}".format(data_count, self.df.shape[0]))
-
-        outpath = os.path.join(self.dpath, 'data.csv')
-        self.df.to_csv(outpath, sep='\t', index=False)
-
-    def interaction_threshold(self, k):
+    def interaction_threshold(self, mask, k, tag_k=1) -> np.ndarray:
         logger = logging.getLogger()
 
-        data_count = self.df.shape[0]
-        logger.info("Begin cleaning... Dataframe Size: {}".format(data_count))
-        cold_start_users = self.df.groupby(['user_id', 'tag_id']).filter(lambda x: len(x) < k)['user_id'].values
-        self.df = self.df[~self.df.user_id.isin(cold_start_users)]
-        logger.info("Removed users with less than {0} unique interactions. Size of DataFrame: {1} -> {2}".format(k, data_count, self.df.shape[0]))
+        rows = np.flatnonzero(mask)
+        logger.info("Begin cleaning... Dataframe Size: {}".format(len(rows)))
+        core, sizes = k_core(self.df.user_id.values[rows], self.df.tag_id.values[rows], k, tag_k)
+        for iteration, pairs, users, tags in sizes:
+            logger.info("k-core iteration {0}: {1} unique interactions, {2} users, {3} cashtags".format(iteration, pairs, users, tags))
 
-        outpath = os.path.join(self.dpath, 'data.csv')
-        self.df.to_csv(outpath, sep='\t', index=False)
+        keep = np.zeros(mask.shape[0], dtype=bool)
+        keep[rows[core]] = True
+        return keep
     
-    def run(self, k):
+    def run(self, k, tag_k=1):
+        """Evaluates all cleaning steps as row masks over the input, then materialises
+        and writes the surviving interactions once.
+
+        """
+
         self.logger()
+        logger = logging.getLogger()
 
         # self.format_data()
-        self.bot_cleaner()
-        self.interaction_threshold(k)
+        pipeline = MaskPipeline()
+        pipeline.add('bot removal', self.bot_cleaner)
+        pipeline.add('interaction threshold (k={0}, tag_k={1})'.format(k, tag_k), lambda mask: self.interaction_threshold(mask, k, tag_k))
+
+        mask, counts = pipeline.evaluate(self.df.shape[0])
+        for name, before, after in counts:
+            logger.info("{0}. Size of DataFrame: {1} -> {2}".format(name, before, after))
+
+        self.df = self.df[mask]
+        self.store.write(self.df)
+        logger.info("Saved {0} interactions to <{1}>".format(self.df.shape[0], self.store.path))
        
         self.clear_logger_settings()
 
 class LibSVMParser(DataPrep):
-    def __init__(self, fp):
+    def __init__(self, name, hashing: int=None):
         super().__init__('libsvmparser')
-        self.df = pd.read_csv(os.path.join(self.dpath, fp), sep='\t')
-        self.df = self.df.drop('timestamp', axis=1)
+        self.df = InteractionStore(os.path.join(self.dpath, name)).read(
+            columns=['user_id', 'tag_id', 'tag_industry', 'tag_sector', 'timestamp']
+        )
         self.df['target'] = 1
         # self.df = self.df.drop_duplicates(subset=['user_id', 'tag_id'])
+        # hashing bounds the column space to a fixed number of features, without a vocabulary
+        if hashing:
+            self.encoder = HashingEncoder(n_features=hashing)
+        else:
+            self.encoder = OneHotEncoder(os.path.join(self.dpath, 'feature_map.json')).load()
+        self.history = {}
+
+    def categorise_features(self, history: bool=False):
+        # the persisted feature map is keyed on the category names themselves, category codes
+        # depend on the dictionary order of each store and would not line up across stores
+        self.df['tag_sector'] = self.df.tag_sector.astype(str).values
+        self.df['tag_industry'] = self.df.tag_industry.astype(str).values
+        if not history:
+            return
+
+        # normalised multi-hot blocks of the cashtags, sectors and industries each user
+        # interacted with, one row per user, broadcast to interaction rows in dummify
+        for name, column in HISTORY_FEATURES.items():
+            self.history[name] = self.encoder.fit_groups(self.df.user_id.values, self.df[column].values, name)
+
+    def neg_sampling(self, df, ratio=2, method='popularity', workers=None):
+        """Adds ratio negative (target -1) samples per positive interaction.
+
+        Negatives are drawn by NegativeSampler and the cashtag attributes of a negative are
+        looked up by its tag_id. The k-th negative of a user takes the timestamp of the user's
+        (k // ratio)-th positive, so that temporal splits see negatives spread like the
+        positives. Users who interacted with every cashtag cannot be given negatives and are
+        dropped.
+
+        Args:
+            df (pandas.DataFrame): Positive interactions.
+            ratio (int): Negatives per positive.
+            method (str): 'uniform' or 'popularity' weighted sampling of negative cashtags.
+            workers (int): Number of processes to shard users across.
 
-    def categorise_features(self):
-        self.df.tag_sector = pd.Categorical(self.df.tag_sector)
-        self.df.tag_industry = pd.Categorical(self.df.tag_industry)
-        self.df['tag_sector'] = self.df.tag_sector.cat.codes
-        self.df['tag_industry'] = self.df.tag_industry.cat.codes
-
-        user_tags = self.df.groupby('user_id')['tag_id'].apply(list)
-        user_sectors = self.df.groupby('user_id')['tag_sector'].apply(list)
-        user_industries = self.df.groupby('user_id')['tag_industry'].apply(list)
-
-        self.df['user_tags'] = ''
-        self.df['user_sectors'] = ''
-        self.df['user_industries'] = ''
-
-        for i, row in self.df.iterrows():
-            user_id = row['user_id']
-            self.df.at[i, 'user_tags'] = user_tags[user_id]
-            self.df.at[i, 'user_sectors'] = user_sectors[user_id]
-            self.df.at[i, 'user_industries'] = user_industries[user_id]
-
-        listjoin = lambda x: ','.join(map(str, x))
-        self.df['user_tags'] = self.df['user_tags'].apply(listjoin)
-        self.df['user_sectors'] = self.df['user_sectors'].apply(listjoin)
-        self.df['user_industries'] = self.df['user_industries'].apply(listjoin)
-
-    def neg_sampling(self, df):
-        def remove_potential_bots(dframe):
-            user_sel = None
-            user_sel_tags = []
-
-            for _, row in df.iterrows():
-                user_sel_tags = df.tag_id[df.user_id == row.user_id].tolist()
-                try:
-                    neg_sample = df[~df.tag_id.isin(user_sel_tags)].sample(n=2)
-                except ValueError:
-                    print("Removed potential bot, UserID: {}. Logging...".format(row.user_id))
-                    return (row.user_id, dframe)
-                # if user_sel != row.user_id:
-                #     user_sel = row.user_id
-                #     user_sel_tags = dframe.tag_id[df.user_id == user_sel].tolist()
-                #     neg_sample = dframe[~dframe.tag_id.isin(user_sel_tags)].sample(n=2)                    
-                #     neg_tags = neg_sample.tag_id.tolist()
-                #     user_sel_tags += neg_tags
-                # else:
-                #     try:
-                #         neg_sample = dframe[~dframe.tag_id.isin(user_sel_tags)].sample(n=2)
-                #         neg_tags = neg_sample.tag_id.tolist()
-                #         user_sel_tags += neg_tags
-                #     except ValueError:
-                #         print("Removed potential bot, UserID: {}. Logging...".format(row.user_id))
-                #         return (row.user_id, dframe)
-            return dframe
-   
-        
-        # print("Dataframe entries: {}, Beginning bot removal...".format(df.shape[0]))
-        # bot_entries = remove_potential_bots(df)
-        # while isinstance(bot_entries, tuple):
-        #     bot_user, df = bot_entries
-        #     df = df[df.user_id != bot_user]
-        #     print("Updated DataFrame, now contains {} entries".format(df.shape[0]))
-        #     bot_entries = remove_potential_bots(df[df.user_id != bot_user])
-        # df = bot_entries
-        # print("Bot removal completed. Dataframe entries: {}".format(df.shape[0]))
-        # df = df.reset_index(drop=True)
-        # df.to_csv(self.dpath+'fm_bot_clean.csv', sep="\t", index=False)
-        # sys.exit(0)
-
-        user_sel = None
-        user_sel_tags = []
-        init_shape = df.shape[0]
+        """
 
-        to_drop = []
+        positives = df[df.target == 1]
+        sampler = NegativeSampler(positives.user_id.values, positives.tag_id.values, ratio=ratio, method=method, workers=workers)
+        neg_users, neg_tags, to_drop = sampler.sample()
 
-        for i, row in df.iterrows():
-            print("{}/{}".format(i+1, init_shape))
-            if row.target == -1: continue
-            if user_sel != row.user_id:
-                user_sel = row.user_id
-                user_sel_tags = df.tag_id[df.user_id == user_sel].tolist()
+        tag_cols = [c for c in ['tag_industry', 'tag_sector'] if c in df]
+        negatives = pd.DataFrame({'user_id': neg_users, 'tag_id': neg_tags})
+        negatives = negatives.merge(positives[['tag_id']+tag_cols].drop_duplicates(subset='tag_id'), on='tag_id', how='left')
+        negatives['target'] = -1
 
-                try:
-                    neg_sample = df[~df.tag_id.isin(user_sel_tags)].sample(n=2)
-                except ValueError:
-                    to_drop.append(row.user_id)
-                    continue
-                neg_sample.user_id = row.user_id
-                neg_sample.target = -1
-                neg_tags = neg_sample.tag_id.tolist()
-                df = df.append(neg_sample)
-                # user_sel_tags += neg_tags       
-            else:
-                try:
-                    neg_sample = df[~df.tag_id.isin(user_sel_tags)].sample(n=2)
-                except ValueError:
-                    to_drop.append(row.user_id)
-                    continue
-                neg_sample.user_id = row.user_id
-                neg_sample.target = -1
-                neg_tags = neg_sample.tag_id.tolist()
-                df = df.append(neg_sample)
-                # user_sel_tags += neg_tags
+        if 'timestamp' in df:
+            by_user = positives.sort_values('user_id', kind='mergesort')
+            first = by_user.user_id.searchsorted(negatives.user_id.values)
+            nth = negatives.groupby('user_id').cumcount().values // ratio
+            negatives['timestamp'] = by_user.timestamp.values[np.minimum(first+nth, by_user.shape[0]-1)]
 
         print("Bots dropped: {}".format(len(to_drop)))
+        df = pd.concat([df, negatives[list(df)]], ignore_index=True)
         df = df[~df.user_id.isin(to_drop)]
         pos_samples, neg_samples = df[df.target == 1].shape[0], df[df.target == -1].shape[0]
         print("Positive samples = {}, Negative samples = {}".format(pos_samples, neg_samples))
-        df = shuffle(df)
+        df = shuffle(df, random_state=1)
         df = df.reset_index(drop=True)
         return df
 
-    def dummify(self, ret_t):
-        df = pd.read_csv(os.path.join(self.dpath, 'libsvm_01_bots.csv'), sep='\t')
+    def dummify(self, ret_t, df=None):
+        if df is None:
+            df = pd.read_csv(os.path.join(self.dpath, 'libsvm_01_bots.csv'), sep='\t')
         print(df.shape[0])
         # user_ids = df.copy()
         # user_ids = user_ids.drop_duplicates(subset='user_id')
@@ -293,75 +341,94 @@ class LibSVMParser(DataPrep):
         cols.insert(0, cols.pop(cols.index('target')))
         df = df[cols]
         
-        user_tags = df.pop('user_tags')
-        user_sectors = df.pop('user_sectors')
-        user_industries = df.pop('user_industries')
+        df = df.drop(columns=list(HISTORY_FEATURES)+['timestamp'], errors='ignore')
 
         cols = list(df)[1:]
 
-        # u_tags_dummies = user_tags.str.get_dummies(sep=',').astype(np.int8).add_prefix('user_tags_')
-        # u_sectors_dummies = user_sectors.str.get_dummies(sep=',').astype(np.int8).add_prefix('user_sectors_')
-        # u_industries_dummies = user_industries.str.get_dummies(sep=',').astype(np.int8).add_prefix('user_industries_')
-
-        # u_tags_dummies = u_tags_dummies.div(u_tags_dummies.sum(axis=1), axis=0).round(4)
-        # u_sectors_dummies = u_sectors_dummies.div(u_sectors_dummies.sum(axis=1), axis=0).round(4)
-        # u_industries_dummies = u_industries_dummies.div(u_industries_dummies.sum(axis=1), axis=0).round(4)
-
-        X = pd.get_dummies(data=df, columns=cols)
-
-        # X = pd.concat(
-        #     [X, u_tags_dummies, u_sectors_dummies, u_industries_dummies],
-        #     axis=1
-        # )
+        X = self.encoder.fit_transform(df, cols)
+        for name, (users, block) in self.history.items():
+            # the extra empty row is picked by the -1 of users without history
+            block = block.copy()
+            block.resize(block.shape[0]+1, X.shape[1])
+            X = X + block[users.get_indexer(df.user_id.values)]
+        self.encoder.save()
 
-        y = X.pop('target')
-        X, y = X.astype('int32'), y.astype('int32')
+        y = df.pop('target')
         print(X.shape, y.shape)
 
         return_type = {
             # 'df': (df, y.transpose()),
             # 'dense': (np.array(X), np.transpose(np.array(y))),
-            'sparse': (scipy.sparse.csr_matrix(X.values).astype(float), scipy.sparse.csr_matrix(y.values).transpose().astype(float))
+            'sparse': (X, scipy.sparse.csr_matrix(y.values).transpose().astype(float))
         }
         return return_type[ret_t]
 
-    def split_train_test(self, sparse_matrices, validation=False) -> tuple:
-        X, y = sparse_matrices
-        if validation:
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=1)
-            X_train, X_val, y_train, y_val = train_test_split(
-                X_train, y_train, test_size=0.25, random_state=1)
-
-            return (
-                (X_train, y_train),
-                (X_val, y_val),
-                (X_test, y_test)
-            )
+    def split_train_test(self, sparse_matrices, validation=False, strategy='random', seed=1, cutoffs=None) -> tuple:
+        """Splits the design matrix by the row indices computed by Splitter.
 
-        else:
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.33, random_state=5)
+        The rows of sparse_matrices must be aligned with self.df, which provides the user ids
+        and timestamps of the user and temporal strategies. The indices are persisted per
+        strategy and reused while the rows and split parameters stay the same.
 
-            return (
-                (X_train, y_train),
-                (X_test, y_test)
-            )
-        raise("Split Error")
+        Args:
+            sparse_matrices (tuple): (X, y) as returned by dummify.
+            validation (bool): Also split off a validation set.
+            strategy (str): 'random', 'user' or 'temporal'. The user and temporal strategies
+                change the evaluation protocol, their results are not comparable with random splits.
+            seed (int): Seed of the random and user strategies.
+            cutoffs (tuple): Optional start timestamps of the validation and test sets of the
+                temporal strategy.
 
-    def run(self):
-        # self.categorise_features()
-        # self.df = self.neg_sampling(self.df)
+        Returns:
+            tuple: (X, y) per set, train, (validation,) test.
+
+        """
+
+        X, y = sparse_matrices
+        splitter = Splitter(
+            strategy=strategy,
+            test_size=0.2 if validation else 0.33,
+            validation_size=0.2 if validation else 0.0,
+            seed=seed,
+            cutoffs=cutoffs,
+            path=os.path.join(self.dpath, 'splits_{}.npz'.format(strategy))
+        )
+        indices = splitter.split(
+            X.shape[0],
+            users=self.df.user_id.values if strategy == 'user' else None,
+            timestamps=self.df.timestamp.values if strategy == 'temporal' else None
+        )
+        for name, idx in indices.items():
+            print("{} rows = {}".format(name, idx.shape[0]))
+        return tuple(splitter.take(indices, X, y))
+
+    def run(self, history: bool=False, negatives: bool=False):
+        """Encodes the interactions and writes the train, validation and test libfm files.
+
+        Args:
+            history (bool): Add the user_tags, user_sectors and user_industries history blocks
+                to the design matrix.
+            negatives (bool): Sample the negatives from the interactions read, instead of
+                encoding the previously sampled interactions of libsvm_01_bots.csv.
+
+        """
+
+        df = None
+        if history or negatives:
+            self.categorise_features(history)
+        if negatives:
+            self.df = self.neg_sampling(self.df)
+            df = self.df.copy()
         # self.df.to_csv(os.path.join(self.dpath, 'libsvm_01_bots.csv'), sep='\t', index=False)
         aliases = ['train', 'test']
-        dummies = self.dummify('sparse')
+        dummies = self.dummify('sparse', df)
         splits = self.split_train_test(dummies, validation=True)
         if len(splits) == 3:
             aliases = aliases[:1] + ['validation'] + aliases[1:]
         for i, s in enumerate(splits):
             X, y = s
             print("Writing {} file".format(aliases[i]))
-            dump_svmlight_file(X, y, os.path.join(self.dpath, aliases[i]+'.libfm'))
+            dump_libfm(X, y, os.path.join(self.dpath, aliases[i]+'.libfm'))
         
 
 
@@ -372,9 +439,9 @@ dp = DataParser('2017_01_02')
 dp.run()
 # dp = DataParser('2017_07_01')
 # # dp.run()
-# dc = DataCleaner('01_symbols.csv')
+# dc = DataCleaner('symbols')
 # # # # # # # dc = DataCleaner('02_interactions.csv')
 # dc.run(5)
 
-libsvm = LibSVMParser('01_symbols.csv')
+libsvm = LibSVMParser('symbols')
 libsvm.run()
\ No newline at end of file
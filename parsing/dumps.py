@@ -0,0 +1,497 @@
+"""Readers for the raw StockTwits daily message dumps.
+
+Each line of a dump is a complete JSON message object, of which only a handful of
+fields are ever used. DumpReader extracts just a declared set of fields per line,
+decoding with simdjson when it is installed (only the requested fields are ever
+materialised as Python objects), falling back to orjson and finally the standard
+library json module.
+
+Dumps may be stored compressed with gzip (.gz), bzip2 (.bz2), xz (.xz) or, when the
+zstandard package is installed, zstd (.zst). open_dump picks the decompressor from
+the file extension, large files are decompressed on a background thread so that
+decompression overlaps with parsing.
+
+ArchiveIndex maps the dates of a directory of daily dumps to their files, line counts
+and sizes, and keeps a sparse timestamp -> byte offset index of every file so that an
+exact time window can be read by seeking instead of scanning.
+
+"""
+
+import bisect
+import bz2
+import calendar
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import re
+import threading
+import time
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 4 << 20
+THREADED_MIN_SIZE = 64 << 20
+
+def _zstd_open(path):
+    if not zstandard:
+        raise ImportError("The zstandard package is required to read {}".format(path))
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+
+DECOMPRESSORS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': _zstd_open
+}
+
+def dump_name(filename) -> str:
+    """Strips a compression extension from a dump file name, eg. 'st_2017_01_01.gz' -> 'st_2017_01_01'.
+
+    """
+
+    root, ext = os.path.splitext(filename)
+    return root if ext in DECOMPRESSORS else filename
+
+def _skip(f, offset):
+    """Moves a file opened by open_dump forward to offset, by reading and discarding the
+    decompressed bytes when the stream cannot seek (eg. zstd).
+
+    """
+
+    if f.seekable():
+        f.seek(offset)
+        return
+    while offset > 0:
+        chunk = f.read(min(offset, CHUNK_SIZE))
+        if not chunk:
+            break
+        offset -= len(chunk)
+
+class ThreadedReader(io.RawIOBase):
+    """Raw stream which reads a file-like object in chunks on a background thread.
+
+    Up to depth chunks are read ahead into a bounded queue, so that decompression
+    (which releases the GIL) runs concurrently with the consumer parsing lines.
+
+    """
+
+    def __init__(self, f, chunk_size: int=CHUNK_SIZE, depth: int=8):
+        super().__init__()
+        self._f = f
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._buffer = memoryview(b'')
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            while True:
+                chunk = self._f.read(self._chunk_size)
+                if not self._put(chunk) or not chunk:
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buffer = memoryview(item)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._f.close()
+        super().close()
+
+def open_dump(path, text: bool=False, threaded: bool=None):
+    """Opens a, possibly compressed, dump file for reading.
+
+    Args:
+        path (str): Path to the dump.
+        text (bool): Open in text mode rather than binary.
+        threaded (bool): Decompress on a background thread, by default only done for
+            compressed files of at least THREADED_MIN_SIZE bytes.
+
+    Returns:
+        A binary or text file object, iterable by line.
+
+    """
+
+    opener = DECOMPRESSORS.get(os.path.splitext(path)[1])
+    if opener is None:
+        return open(path, 'r' if text else 'rb')
+
+    f = opener(path)
+    if threaded is None:
+        threaded = os.path.getsize(path) >= THREADED_MIN_SIZE
+    if threaded:
+        f = io.BufferedReader(ThreadedReader(f), buffer_size=CHUNK_SIZE)
+    return io.TextIOWrapper(f, encoding='utf-8') if text else f
+
+def _loader():
+    if simdjson:
+        return simdjson.Parser().parse
+    if orjson:
+        return orjson.loads
+    return json.loads
+
+def _get(node, key):
+    try:
+        return node[key]
+    except (KeyError, TypeError):
+        return None
+
+def _materialise(node):
+    if simdjson and isinstance(node, simdjson.Object):
+        return node.as_dict()
+    if simdjson and isinstance(node, simdjson.Array):
+        return node.as_list()
+    return node
+
+def _extract(node, parts):
+    for i, p in enumerate(parts):
+        if node is None:
+            return None
+        if p.endswith('[*]'):
+            node = _get(node, p[:-3])
+            if not node:
+                return ()
+            return tuple(_extract(n, parts[i+1:]) for n in node)
+        node = _get(node, p)
+    return _materialise(node)
+
+class DumpReader:
+    """Field-projecting reader for JSON-lines dumps.
+
+    Fields are declared as dotted paths into the message object. A path component
+    ending in '[*]' fans out over a list, the field then yields a tuple with one value
+    per list element, eg. 'data.symbols[*].id' -> (686, 7271).
+
+    Attributes:
+        fields (list): Dotted paths of the fields to extract.
+        require (bytes): Lines not containing this substring are skipped without being decoded.
+        batch_size (int): Number of records yielded per batch by DumpReader.batches.
+
+    Examples:
+        >>> reader = DumpReader(['data.user.id', 'data.symbols[*].id'], require=b'"symbols"')
+        >>> for user_id, symbol_ids in reader.records(path):
+        ...     pass
+
+    """
+
+    def __init__(self, fields, require: bytes=None, batch_size: int=10000):
+        self.fields = fields
+        self.require = require
+        self.batch_size = batch_size
+        self._paths = [f.split('.') for f in fields]
+
+    def records(self, path):
+        """Yields one tuple of the declared field values per line of the dump at path.
+
+        """
+
+        with open_dump(path) as f:
+            yield from self.decode(f)
+
+    def decode(self, lines):
+        """Yields one tuple of the declared field values per line of an iterable of bytes lines,
+        eg. ArchiveIndex.window.
+
+        """
+
+        loads = _loader()
+        for line in lines:
+            if self.require and self.require not in line:
+                continue
+            doc = loads(line)
+            record = tuple(_extract(doc, p) for p in self._paths)
+            # simdjson refuses to parse the next line while the previous document is referenced
+            del doc
+            yield record
+
+    def batches(self, path):
+        """Yields lists of up to batch_size record tuples.
+
+        """
+
+        batch = []
+        for record in self.records(path):
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def iter_keys(path):
+    """Yields the top-level key of each line of a file of single-key JSON objects, eg. {"user": {...}},
+    decoding only the key itself.
+
+    """
+
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line[1:line.index('":')+1])
+
+DATE_PATTERN = re.compile(r'(\d{4}_\d{2}_\d{2})')
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def _epoch(value) -> int:
+    """Converts a StockTwits timestamp, or a window bound such as '2017-03-01T00:00', to UTC epoch seconds.
+
+    """
+
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = value.rstrip('Z')
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError("Unrecognised timestamp: {}".format(value))
+
+class ArchiveIndex:
+    """Date and time index over a directory of daily dumps.
+
+    For every dump whose (decompressed) name ends in a YYYY_MM_DD date the index keeps
+    its file name, line count and decompressed size, as well as a sparse list of
+    [timestamp, byte offset] pairs sampled every stride lines. The index is saved as
+    JSON and only files whose size or modification time changed are rescanned.
+
+    Byte offsets are offsets into the decompressed stream, so for compressed dumps a
+    seek still decompresses up to the offset (streams which cannot seek at all, like zstd,
+    are read forward to it), but nothing has to be parsed.
+
+    Attributes:
+        directory (str): Directory holding the dumps.
+        path (str): Path of the saved index, by default .archive_index.json in directory.
+        stride (int): Number of lines between sampled offsets.
+        timestamp_field (str): Dotted path of the message timestamp, see DumpReader.
+        entries (dict): Maps each date (YYYY_MM_DD) to its file entry.
+
+    Examples:
+        >>> index = ArchiveIndex('/media/ntfs/st_2017').build()
+        >>> for line in index.window('2017-03-01T00:00', '2017-03-15T12:00'):
+        ...     pass
+
+    """
+
+    def __init__(self, directory, path: str=None, stride: int=1000, timestamp_field: str='data.created_at'):
+        self.directory = directory
+        self.path = path or os.path.join(directory, '.archive_index.json')
+        self.stride = stride
+        self.timestamp_field = timestamp_field
+        self._timestamp_path = timestamp_field.split('.')
+        self.entries = self._read()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self):
+        tmp_path = self.path+'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def date(filename) -> str:
+        match = DATE_PATTERN.search(dump_name(filename))
+        return match.group(1) if match else None
+
+    def _timestamp(self, loads, line):
+        try:
+            doc = loads(line)
+        except ValueError:
+            return None
+        value = _extract(doc, self._timestamp_path)
+        del doc
+        return _epoch(value) if isinstance(value, str) else None
+
+    def scan(self, filename) -> dict:
+        """Counts the lines of a dump and samples its timestamp -> byte offset index.
+
+        """
+
+        path = os.path.join(self.directory, filename)
+        stat = os.stat(path)
+        loads = _loader()
+        lines, offset, samples = 0, 0, []
+        with open_dump(path) as f:
+            for line in f:
+                if lines % self.stride == 0:
+                    ts = self._timestamp(loads, line)
+                    if ts is not None:
+                        samples.append([ts, offset])
+                lines += 1
+                offset += len(line)
+        ordered = all(a[0] <= b[0] for a, b in zip(samples, samples[1:]))
+        return {
+            'file': filename,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'lines': lines,
+            'bytes': offset,
+            'ordered': ordered,
+            'offsets': samples
+        }
+
+    def build(self, files: list=None):
+        """Indexes new or changed dumps in the directory and drops entries of removed ones.
+
+        Args:
+            files (list): Only index these dumps, the entries of all other dumps are kept as
+                they are.
+
+        Returns:
+            ArchiveIndex: self, for chaining.
+
+        """
+
+        current = {} if files is None else dict(self.entries)
+        for f in sorted(os.listdir(self.directory) if files is None else files):
+            date = self.date(f)
+            if f.startswith('.') or not date or not os.path.isfile(os.path.join(self.directory, f)):
+                continue
+            entry = self.entries.get(date)
+            stat = os.stat(os.path.join(self.directory, f))
+            if entry and entry['file'] == f and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                current[date] = entry
+            else:
+                current[date] = self.scan(f)
+        self.entries = current
+        self.save()
+        return self
+
+    @property
+    def dates(self) -> list:
+        return sorted(self.entries)
+
+    def files(self, date_from: str=None, date_to: str=None) -> list:
+        """Returns the dump file names between two dates (YYYY_MM_DD), both inclusive.
+
+        """
+
+        return [self.entries[d]['file'] for d in self.dates if (not date_from or d >= date_from) and (not date_to or d <= date_to)]
+
+    def _file_window(self, entry, start, end):
+        """Yields the lines of one dump with start <= timestamp <= end.
+
+        Lines between two samples which are both inside the window are yielded without
+        being decoded, only the lines in the sample blocks around the bounds are checked.
+
+        """
+
+        loads = _loader()
+        samples = entry['offsets']
+        path = os.path.join(self.directory, entry['file'])
+        if not entry['ordered'] or not samples:
+            with open_dump(path) as f:
+                for line in f:
+                    ts = self._timestamp(loads, line)
+                    if ts is not None and start <= ts <= end:
+                        yield line
+            return
+
+        stamps = [s[0] for s in samples]
+        lo = bisect.bisect_left(stamps, start)
+        hi = bisect.bisect_right(stamps, end)
+        seek_to = samples[lo-1][1] if lo > 0 else 0
+        checked_until = samples[lo][1] if lo < len(samples) else entry['bytes']
+        checked_from = samples[hi-1][1] if hi > 0 else 0
+        stop_at = samples[hi][1] if hi < len(samples) else entry['bytes']
+
+        with open_dump(path, threaded=False) as f:
+            _skip(f, seek_to)
+            offset = seek_to
+            for line in f:
+                if offset >= stop_at:
+                    break
+                if offset < checked_until or offset >= checked_from:
+                    ts = self._timestamp(loads, line)
+                    if ts is not None and start <= ts <= end:
+                        yield line
+                else:
+                    yield line
+                offset += len(line)
+
+    def window(self, start, end, files: list=None):
+        """Yields the raw (bytes) lines of every message with start <= timestamp <= end.
+
+        Args:
+            start: Window start, epoch seconds or ISO-8601 UTC string, eg. '2017-03-01T00:00'.
+            end: Window end, inclusive.
+            files (list): Restrict the window to these dump files.
+
+        """
+
+        start, end = _epoch(start), _epoch(end)
+        for f in self.window_files(start, end):
+            if files is not None and f not in files:
+                continue
+            yield from self._file_window(self.entries[self.date(f)], start, end)
+
+    @staticmethod
+    def window_dates(start, end) -> tuple:
+        """Returns the first and last date (YYYY_MM_DD) of the dumps which may hold messages
+        between start and end, without needing an index.
+
+        """
+
+        day = lambda ts: time.strftime('%Y_%m_%d', time.gmtime(ts))
+        # a day's dump may hold a few messages either side of midnight UTC
+        return day(_epoch(start)-86400), day(_epoch(end)+86400)
+
+    def window_files(self, start, end) -> list:
+        """Returns the dump files which may hold messages between start and end.
+
+        """
+
+        return self.files(*self.window_dates(start, end))
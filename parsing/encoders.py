@@ -0,0 +1,291 @@
+from sklearn.utils import murmurhash3_32
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import json
+import logging
+import os
+
+class OneHotEncoder:
+    """One-hot encodes categorical columns straight into a CSR design matrix.
+
+    Every (column, value) feature is assigned a fixed column of the design matrix. The
+    assignment is kept in a JSON feature map which only ever grows, features unseen so far
+    are appended after the existing ones, so matrices encoded at different times (eg. train
+    and test) share their column space. Since every encoded column contributes at most one
+    non-zero per row, the CSR arrays are built directly from the looked up column ids,
+    without a dense intermediate.
+
+    Layout of the feature map:
+        columns: Encoded columns, in order.
+        features: Per column, the list of values and the list of their matrix columns.
+        size: Number of matrix columns assigned so far.
+
+    Attributes:
+        path (str): Path of the JSON feature map, the map is not persisted if None.
+
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.columns = []
+        self.features = {}
+        self.size = 0
+        self._indices = {}
+
+    def load(self):
+        """Loads the feature map from self.path, if it exists.
+
+        Returns:
+            OneHotEncoder: self, for chaining.
+
+        """
+
+        if self.path is None or not os.path.exists(self.path):
+            return self
+        with open(self.path) as f:
+            feature_map = json.load(f)
+        self.columns = feature_map['columns']
+        self.features = feature_map['features']
+        self.size = feature_map['size']
+        self._indices = {}
+        return self
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path, 'w') as f:
+            json.dump({'columns': self.columns, 'features': self.features, 'size': self.size}, f)
+
+    def _index(self, column) -> pd.Index:
+        if column not in self._indices:
+            self._indices[column] = pd.Index(self.features[column]['values'])
+        return self._indices[column]
+
+    def _lookup(self, column, values) -> np.ndarray:
+        """Matrix column of each value, -1 for values not in the feature map."""
+
+        if column not in self.features:
+            return np.full(len(values), -1, dtype=np.int64)
+        idx = self._index(column).get_indexer(values)
+        cols = np.asarray(self.features[column]['columns'], dtype=np.int64)
+        return np.where(idx >= 0, cols[idx], -1)
+
+    def fit(self, df, columns):
+        """Adds the values of the given columns which are not yet in the feature map.
+
+        Args:
+            df (pandas.DataFrame): Data to encode.
+            columns (list): Columns to one-hot encode.
+
+        Returns:
+            OneHotEncoder: self, for chaining.
+
+        """
+
+        for column in columns:
+            values = pd.unique(df[column].values)
+            if column not in self.features:
+                self.columns.append(column)
+                self.features[column] = {'values': [], 'columns': []}
+            new = values[self._index(column).get_indexer(values) < 0]
+            if new.shape[0] == 0:
+                continue
+            new = np.sort(new)
+            self.features[column]['values'] += new.tolist()
+            self.features[column]['columns'] += list(range(self.size, self.size+new.shape[0]))
+            self.size += new.shape[0]
+            self._indices.pop(column, None)
+        return self
+
+    def transform(self, df) -> scipy.sparse.csr_matrix:
+        """Encodes the columns of the feature map present in df, values not in the map are
+        left all zero.
+
+        Returns:
+            scipy.sparse.csr_matrix: Matrix of shape (rows, self.size).
+
+        """
+
+        rows = df.shape[0]
+        columns = [c for c in self.columns if c in df]
+        cols = np.column_stack([self._lookup(c, df[c].values) for c in columns]) if columns else np.empty((rows, 0), dtype=np.int64)
+        known = cols >= 0
+
+        indptr = np.zeros(rows+1, dtype=np.int64)
+        np.cumsum(known.sum(axis=1), out=indptr[1:])
+        indices = cols[known]
+        data = np.ones(indices.shape[0], dtype=np.float64)
+
+        X = scipy.sparse.csr_matrix((data, indices, indptr), shape=(rows, self.size))
+        X.sort_indices()
+        return X
+
+    def fit_transform(self, df, columns) -> scipy.sparse.csr_matrix:
+        return self.fit(df, columns).transform(df)
+
+    def fit_groups(self, keys, values, column, normalise: bool=True) -> tuple:
+        """Encodes a multi-hot row per key (eg. per user) of all the values it occurs with.
+
+        The values are added to the feature map under the given column name, so the rows share
+        the column space of the one-hot features and the block can be broadcast to interaction
+        rows by key and added to them. Each distinct value of a key is counted once, with
+        normalise every row is scaled to sum to 1.
+
+        Args:
+            keys (array-like): Key per observation.
+            values (array-like): Value per observation.
+            column (str): Feature map column to encode the values under, eg. 'user_tags'.
+            normalise (bool): Scale rows to sum to 1.
+
+        Returns:
+            tuple: (pandas.Index, scipy.sparse.csr_matrix), the keys and their multi-hot rows
+                of shape (keys, self.size).
+
+        """
+
+        values = np.asarray(values)
+        self.fit(pd.DataFrame({column: values}), [column])
+
+        key_codes, key_index = pd.factorize(np.asarray(keys))
+        key_index = pd.Index(key_index)
+        cols = self._lookup(column, values)
+        pairs = np.unique(key_codes.astype(np.int64)*self.size+cols)
+        rows, indices = pairs // self.size, pairs % self.size
+
+        counts = np.bincount(rows, minlength=len(key_index))
+        indptr = np.zeros(len(key_index)+1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        data = 1/counts[rows] if normalise else np.ones(indices.shape[0])
+
+        return key_index, scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(key_index), self.size))
+
+    def feature_names(self) -> list:
+        names = [None]*self.size
+        for column in self.columns:
+            for value, col in zip(self.features[column]['values'], self.features[column]['columns']):
+                names[col] = '{}_{}'.format(column, value)
+        return names
+
+class HashingEncoder:
+    """Feature-hashing counterpart of OneHotEncoder with a fixed number of columns.
+
+    The matrix column of a (column, value) feature is its signed 32-bit murmurhash, seeded per
+    column, modulo n_features, so no vocabulary has to be built or persisted and matrices
+    encoded separately (eg. month by month) always share their column space. With signed
+    hashing the sign of the hash is used as the value, so colliding features tend to cancel
+    out rather than add up. Only the unique values of each column are hashed, integer values
+    in a single vectorised call.
+
+    Collisions among all features hashed so far are recorded in self.collisions, the distinct
+    32-bit hashes of a column standing in for its distinct values.
+
+    Attributes:
+        n_features (int): Number of matrix columns.
+        signed (bool): Use the sign of the hash as the feature value.
+        seed (int): Seed the per column hash seeds are derived from.
+
+    """
+
+    def __init__(self, n_features: int=2**20, signed: bool=True, seed: int=0):
+        self.n_features = n_features
+        self.signed = signed
+        self.seed = seed
+        self.columns = []
+        self.collisions = {}
+        self._features = {}
+
+    @property
+    def size(self) -> int:
+        return self.n_features
+
+    def load(self):
+        return self
+
+    def save(self):
+        pass
+
+    def _hash(self, column, values) -> tuple:
+        """Matrix column and sign of every value, hashing each unique value once."""
+
+        codes, uniques = pd.factorize(np.asarray(values))
+        uniques = np.asarray(uniques)
+        column_seed = murmurhash3_32(column, seed=self.seed, positive=True)
+        if uniques.dtype.kind in 'iu' and (uniques.shape[0] == 0 or (uniques.min() >= np.iinfo(np.int32).min and uniques.max() <= np.iinfo(np.int32).max)):
+            hashes = murmurhash3_32(uniques.astype(np.int32), seed=column_seed)
+        else:
+            hashes = np.array([murmurhash3_32(str(v), seed=column_seed) for v in uniques], dtype=np.int32)
+        hashes = np.asarray(hashes, dtype=np.int64)
+
+        cols = np.abs(hashes) % self.n_features
+        signs = np.where(hashes >= 0, 1.0, -1.0) if self.signed else np.ones(hashes.shape[0])
+        seen = self._features.get(column, np.empty(0, dtype=np.int64))
+        self._features[column] = np.union1d(seen, hashes)
+        return cols[codes], signs[codes]
+
+    def _record_collisions(self):
+        features = sum(h.shape[0] for h in self._features.values())
+        buckets = np.unique(np.abs(np.concatenate(list(self._features.values()))) % self.n_features).shape[0] if self._features else 0
+        self.collisions = {
+            'features': features,
+            'buckets': buckets,
+            'rate': 1-buckets/features if features else 0.0
+        }
+        logging.info("Hashed {} features into {} of {} columns, collision rate {:.4f}".format(
+            features, buckets, self.n_features, self.collisions['rate']))
+
+    def fit(self, df, columns):
+        for column in columns:
+            if column not in self.columns:
+                self.columns.append(column)
+        return self
+
+    def transform(self, df) -> scipy.sparse.csr_matrix:
+        """Hashes the fitted columns present in df.
+
+        Returns:
+            scipy.sparse.csr_matrix: Matrix of shape (rows, self.n_features).
+
+        """
+
+        rows = df.shape[0]
+        columns = [c for c in self.columns if c in df]
+        hashed = [self._hash(c, df[c].values) for c in columns]
+        self._record_collisions()
+
+        indices = np.column_stack([h[0] for h in hashed]).ravel() if hashed else np.empty(0, dtype=np.int64)
+        data = np.column_stack([h[1] for h in hashed]).ravel() if hashed else np.empty(0)
+        indptr = np.arange(rows+1, dtype=np.int64)*len(columns)
+
+        X = scipy.sparse.csr_matrix((data, indices, indptr), shape=(rows, self.n_features))
+        X.sum_duplicates()
+        return X
+
+    def fit_transform(self, df, columns) -> scipy.sparse.csr_matrix:
+        return self.fit(df, columns).transform(df)
+
+    def fit_groups(self, keys, values, column, normalise: bool=True) -> tuple:
+        """Hashed equivalent of OneHotEncoder.fit_groups.
+
+        Returns:
+            tuple: (pandas.Index, scipy.sparse.csr_matrix), the keys and their multi-hot rows
+                of shape (keys, self.n_features).
+
+        """
+
+        key_codes, key_index = pd.factorize(np.asarray(keys))
+        key_index = pd.Index(key_index)
+        value_codes, value_index = pd.factorize(np.asarray(values))
+
+        # each distinct value of a key counts once
+        pairs = np.unique(key_codes.astype(np.int64)*len(value_index)+value_codes)
+        rows, values = pairs // len(value_index), np.asarray(value_index)[pairs % len(value_index)]
+        cols, signs = self._hash(column, values)
+        self._record_collisions()
+
+        counts = np.bincount(rows, minlength=len(key_index))
+        data = signs/counts[rows] if normalise else signs
+        X = scipy.sparse.csr_matrix((data, (rows, cols)), shape=(len(key_index), self.n_features))
+        return key_index, X
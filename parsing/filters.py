@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+def k_core(users, tags, user_k: int, tag_k: int=1) -> tuple:
+    """Iteratively filters interactions down to their (user_k, tag_k)-core.
+
+    Users with fewer than user_k unique cashtags and cashtags with fewer than tag_k unique
+    users are removed, repeating until both thresholds hold, since removing users can drop
+    cashtags below their threshold and vice versa. Ids are integer coded and counted with
+    numpy.bincount over the unique user-cashtag pairs, so every iteration is a handful of
+    vectorised passes.
+
+    Args:
+        users (array-like): User id per interaction.
+        tags (array-like): Cashtag id per interaction.
+        user_k (int): Minimum number of unique cashtags per user.
+        tag_k (int): Minimum number of unique users per cashtag.
+
+    Returns:
+        tuple: (numpy.ndarray, list), boolean mask of the interactions in the core and a list
+            of (iteration, pairs, users, cashtags) sizes, one per iteration.
+
+    """
+
+    user_codes, user_uniques = pd.factorize(np.asarray(users))
+    tag_codes, tag_uniques = pd.factorize(np.asarray(tags))
+    n_users, n_tags = len(user_uniques), len(tag_uniques)
+
+    pairs, inverse = np.unique(user_codes.astype(np.int64)*n_tags+tag_codes, return_inverse=True)
+    pair_users, pair_tags = pairs // n_tags, pairs % n_tags
+
+    alive = np.ones(len(pairs), dtype=bool)
+    sizes = []
+    iteration = 0
+    while True:
+        user_counts = np.bincount(pair_users[alive], minlength=n_users)
+        tag_counts = np.bincount(pair_tags[alive], minlength=n_tags)
+        sizes.append((iteration, int(alive.sum()), int((user_counts > 0).sum()), int((tag_counts > 0).sum())))
+
+        keep = alive & (user_counts[pair_users] >= user_k) & (tag_counts[pair_tags] >= tag_k)
+        if keep.sum() == alive.sum():
+            break
+        alive = keep
+        iteration += 1
+
+    return alive[inverse.reshape(-1)], sizes
+
+class MaskPipeline:
+    """Lazy, composable chain of row filters.
+
+    Each step is a function taking the boolean mask of the rows which survived the previous
+    steps and returning the mask of rows it keeps. Nothing is materialised while the steps
+    are evaluated, the caller indexes its data with the final mask once.
+
+    Examples:
+        >>> pipeline = MaskPipeline().add('bots', drop_bots).add('k-core', threshold)
+        >>> mask, counts = pipeline.evaluate(df.shape[0])
+        >>> df = df[mask]
+
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def add(self, name, step):
+        self.steps.append((name, step))
+        return self
+
+    def evaluate(self, rows: int) -> tuple:
+        """Runs the steps in order over the given number of rows.
+
+        Returns:
+            tuple: (numpy.ndarray, list), the combined boolean mask and a list of
+                (step name, rows before, rows after), one per step.
+
+        """
+
+        mask = np.ones(rows, dtype=bool)
+        counts = []
+        for name, step in self.steps:
+            before = int(mask.sum())
+            mask &= step(mask)
+            counts.append((name, before, int(mask.sum())))
+        return mask, counts
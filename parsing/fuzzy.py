@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import Levenshtein
+
+import collections
+import multiprocessing
+
+_JOIN = None
+
+def ngrams(s: str, n: int=3) -> set:
+    padded = ' {} '.format(s)
+    return {padded[i:i+n] for i in range(max(1, len(padded)-n+1))}
+
+def ratios(a, b) -> np.ndarray:
+    """Levenshtein ratio of every aligned pair of strings of a and b, missing values score 0."""
+
+    return np.array([Levenshtein.ratio(x, y) if isinstance(x, str) and isinstance(y, str) else 0.0 for x, y in zip(a, b)], dtype=np.float64)
+
+def drop_worse_matches(df, duplicated_on, group, left, right) -> pd.DataFrame:
+    """Deduplicates rows by keeping only the best title match of each group.
+
+    Among the rows sharing their duplicated_on values with another row, the ratio of the left
+    and right columns is computed in one pass, the row with the highest ratio of every group
+    is kept (the first on ties) and all others are dropped in a single step.
+
+    Args:
+        df (pandas.DataFrame): Rows to deduplicate, eg. the result of a merge.
+        duplicated_on (list): Columns identifying duplicate rows.
+        group (str): Column of the groups a single best row is kept of.
+        left (str): Column compared, eg. 'title_x'.
+        right (str): Column compared against, eg. 'title_y'.
+
+    Returns:
+        pandas.DataFrame: df without the losing duplicates.
+
+    """
+
+    duplicates = df[df.duplicated(subset=duplicated_on, keep=False)]
+    if duplicates.empty:
+        return df
+    scores = pd.Series(ratios(duplicates[left], duplicates[right]), index=duplicates.index)
+    winners = scores.groupby(duplicates[group], dropna=False, sort=False).idxmax()
+    return df.drop(duplicates.index.difference(winners))
+
+class FuzzyJoin:
+    """Blocked fuzzy join of query strings against a list of reference strings.
+
+    Instead of scoring every query against every reference string, the reference strings are
+    indexed by their character n-grams and a query is only scored against the candidates
+    sharing at least min_shared n-grams with it (blocking). Queries equal to a reference
+    string are matched through a hash lookup without any scoring. The remaining queries are
+    scored with the Levenshtein ratio, in parallel over a process pool.
+
+    Attributes:
+        choices (list): Unique reference strings.
+        n (int): Length of the n-grams.
+        threshold (float): Minimum ratio of a match.
+        min_shared (int): Minimum number of n-grams a candidate shares with the query.
+        max_candidates (int): Only the candidates sharing the most n-grams are scored, all if None.
+        workers (int): Processes scoring queries.
+
+    """
+
+    def __init__(self, choices, n: int=3, threshold: float=0.0, min_shared: int=1, max_candidates: int=None, workers: int=None):
+        self.choices = list(pd.unique(pd.Series(list(choices), dtype=object).dropna()))
+        self.n = n
+        self.threshold = threshold
+        self.min_shared = min_shared
+        self.max_candidates = max_candidates
+        self.workers = workers or multiprocessing.cpu_count()
+
+        self.exact = {c: i for i, c in enumerate(self.choices)}
+        postings = collections.defaultdict(list)
+        for i, choice in enumerate(self.choices):
+            for gram in ngrams(choice, n):
+                postings[gram].append(i)
+        self.index = {gram: np.array(ids, dtype=np.int64) for gram, ids in postings.items()}
+
+    def candidates(self, query: str) -> np.ndarray:
+        """Ids of the reference strings sharing at least min_shared n-grams with query."""
+
+        lists = [self.index[g] for g in ngrams(query, self.n) if g in self.index]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.choices))
+        ids = np.flatnonzero(shared >= self.min_shared)
+        if self.max_candidates is not None and ids.shape[0] > self.max_candidates:
+            ids = ids[np.argsort(-shared[ids], kind='mergesort')[:self.max_candidates]]
+        return ids
+
+    def match_one(self, query: str) -> tuple:
+        """Returns the best matching reference string of query and its ratio, (None, score)
+        when the best ratio is below the threshold.
+
+        """
+
+        if query in self.exact:
+            return query, 1.0
+        best, score = None, 0.0
+        for i in self.candidates(query):
+            ratio = Levenshtein.ratio(query, self.choices[i])
+            if ratio > score:
+                best, score = self.choices[i], ratio
+        if score < self.threshold:
+            return None, score
+        return best, score
+
+    def _match_chunk(self, queries) -> list:
+        return [self.match_one(q) for q in queries]
+
+    def match(self, queries) -> pd.DataFrame:
+        """Matches every query, scoring each distinct non exact query once.
+
+        Returns:
+            pandas.DataFrame: 'match' and 'score' columns, aligned with queries.
+
+        """
+
+        index = queries.index if isinstance(queries, pd.Series) else None
+        queries = pd.Series(list(queries), dtype=object, index=index).fillna('')
+        unique = pd.unique(queries)
+        exact = [q for q in unique if q in self.exact]
+        fuzzy = [q for q in unique if q not in self.exact]
+
+        results = {q: (q, 1.0) for q in exact}
+        # the threshold of 1 only admits exact matches, the rest are not scored (score 0)
+        if self.threshold < 1.0 and fuzzy:
+            chunks = [list(c) for c in np.array_split(np.array(fuzzy, dtype=object), min(self.workers, len(fuzzy)))]
+            if self.workers > 1 and len(fuzzy) > 1:
+                with multiprocessing.Pool(processes=self.workers, initializer=_init_worker, initargs=(self,)) as pool:
+                    scored = pool.map(_match_chunk, chunks)
+            else:
+                scored = [self._match_chunk(c) for c in chunks]
+            for chunk, chunk_scores in zip(chunks, scored):
+                results.update(zip(chunk, chunk_scores))
+        else:
+            results.update((q, (None, 0.0)) for q in fuzzy)
+
+        matched = [results[q] for q in queries]
+        return pd.DataFrame(matched, columns=['match', 'score'], index=queries.index)
+
+def _init_worker(join):
+    global _JOIN
+    _JOIN = join
+
+def _match_chunk(queries) -> list:
+    return _JOIN._match_chunk(queries)
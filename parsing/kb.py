@@ -0,0 +1,223 @@
+import pandas as pd
+
+import re
+import sqlite3
+
+from dumps import open_dump
+
+PREDICATES = {
+    'label': 'http://www.w3.org/2000/01/rdf-schema#label',
+    'comment': 'http://www.w3.org/2000/01/rdf-schema#comment',
+    'sameAs': 'http://www.w3.org/2002/07/owl#sameAs',
+    'type': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type',
+    'symbol': 'http://dbpedia.org/property/symbol',
+    'subject': 'http://purl.org/dc/terms/subject'
+}
+PREDICATE_IDS = {iri: i for i, iri in enumerate(PREDICATES.values())}
+LISTED_ON = [
+    'http://dbpedia.org/class/yago/WikicatCompaniesListedOnNASDAQ',
+    'http://dbpedia.org/class/yago/WikicatCompaniesListedOnTheNewYorkStockExchange'
+]
+WIKIDATA_PREFIX = 'http://www.wikidata.org/entity/'
+SEARCH_COLUMNS = ['text', 'o', 's', 'p', 'lang']
+
+TRIPLE_PATTERN = re.compile(r'^(<[^>]*>|_:\S+)\s+<([^>]*)>\s+(.*?)\s*\.\s*$')
+LITERAL_PATTERN = re.compile(r'^"(.*)"(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?$')
+ESCAPE_PATTERN = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+def _unescape(value: str) -> str:
+    def replace(m):
+        e = m.group(1)
+        return chr(int(e[1:], 16)) if e[0] in 'uU' and len(e) > 1 else ESCAPES.get(e, e)
+    return ESCAPE_PATTERN.sub(replace, value) if '\\' in value else value
+
+def _term(term: str) -> tuple:
+    """Value and language tag of an N-Triples subject or object."""
+
+    if term.startswith('<'):
+        return term[1:-1], None
+    m = LITERAL_PATTERN.match(term)
+    if m:
+        return _unescape(m.group(1)), m.group(2).lower() if m.group(2) else None
+    return term, None
+
+class KnowledgeBase:
+    """Local, SQLite backed extract of the DBpedia triples the Queryer templates touch.
+
+    An N-Triples dump (optionally compressed) is streamed once and only the triples of the
+    PREDICATES are kept, in a single triples(s, p, o, lang) table indexed by subject and by
+    predicate and object. The labels and the symbols, which the templates match by substring,
+    are also kept in a trigram full-text table, search(text, o, s, p, lang), whose text is the
+    lower cased object, so a substring lookup is an index probe rather than a scan of every
+    label. Every q_* method is the local equivalent of the Queryer template of the same name:
+    instead of one request per VALUES batch, all rows are loaded into a temporary table and
+    resolved by a single join, returning the columns of the SPARQL results. Where a method can
+    only approximate its template, its docstring says how.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # Unicode aware counterpart of SPARQL's lcase, SQLite's lower only folds ASCII
+        self.conn.create_function('lcase', 1, lambda o: o.lower() if o is not None else None, deterministic=True)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS triples (s TEXT, p INTEGER, o TEXT, lang TEXT)')
+        # full-text tables of earlier layouts are rebuilt
+        if [r[1] for r in self.conn.execute('PRAGMA table_info(search)')] not in ([], SEARCH_COLUMNS):
+            self.conn.execute('DROP TABLE search')
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(text, o UNINDEXED, s UNINDEXED, p UNINDEXED, lang UNINDEXED, tokenize='trigram case_sensitive 0')"
+        )
+        if self.exists() and self.conn.execute('SELECT 1 FROM search LIMIT 1').fetchone() is None:
+            self.index_search()
+
+    def exists(self) -> bool:
+        return self.conn.execute('SELECT 1 FROM triples LIMIT 1').fetchone() is not None
+
+    def load(self, path, batch_size: int=100000) -> int:
+        """Streams the triples of the PREDICATES from an N-Triples file into the database.
+
+        Returns:
+            int: Number of triples loaded.
+
+        """
+
+        self.conn.execute('DROP INDEX IF EXISTS triples_sp')
+        self.conn.execute('DROP INDEX IF EXISTS triples_po')
+        loaded, batch = 0, []
+        insert = 'INSERT INTO triples VALUES (?, ?, ?, ?)'
+        with open_dump(path, text=True) as f:
+            for line in f:
+                m = TRIPLE_PATTERN.match(line)
+                if not m or m.group(2) not in PREDICATE_IDS:
+                    continue
+                s, _ = _term(m.group(1))
+                o, lang = _term(m.group(3))
+                batch.append((s, PREDICATE_IDS[m.group(2)], o, lang))
+                if len(batch) >= batch_size:
+                    self.conn.executemany(insert, batch)
+                    loaded, batch = loaded+len(batch), []
+        self.conn.executemany(insert, batch)
+        loaded += len(batch)
+
+        self.conn.execute('CREATE INDEX triples_sp ON triples (s, p)')
+        self.conn.execute('CREATE INDEX triples_po ON triples (p, o)')
+        self.index_search()
+        return loaded
+
+    def index_search(self):
+        """(Re)builds the full-text table of the labels and the symbols."""
+
+        self.conn.execute('DELETE FROM search')
+        self.conn.execute(
+            'INSERT INTO search (text, o, s, p, lang) SELECT lcase(o), o, s, p, lang FROM triples WHERE p IN (:label, :symbol)',
+            {'label': PREDICATE_IDS[PREDICATES['label']], 'symbol': PREDICATE_IDS[PREDICATES['symbol']]}
+        )
+        self.conn.commit()
+
+    def _values(self, rows: pd.DataFrame, columns: list):
+        self.conn.execute('DROP TABLE IF EXISTS temp.vals')
+        self.conn.execute('CREATE TEMP TABLE vals ({})'.format(', '.join(columns)))
+        self.conn.executemany('INSERT INTO temp.vals VALUES ({})'.format(', '.join('?'*len(columns))),
+                              rows[columns].itertuples(index=False, name=None))
+
+    def _select(self, sql: str) -> pd.DataFrame:
+        params = {k: PREDICATE_IDS[iri] for k, iri in PREDICATES.items()}
+        params.update({'nasdaq': LISTED_ON[0], 'nyse': LISTED_ON[1], 'wikidata': WIKIDATA_PREFIX})
+        results_df = pd.read_sql_query(sql, self.conn, params=params).drop_duplicates()
+        return results_df.replace(regex={r'\t': ' '})
+
+    def q_entity(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Local q_entity, rows holds the 'key' and 'wdEntity' of every cashtag.
+
+        The symbol and the type are joined as one optional pair, like the single OPTIONAL
+        group of the template, so an entity without either has neither. The template requires
+        an English comment but never binds dbpDescription, which is therefore always empty.
+
+        """
+
+        self._values(rows, ['key', 'wdEntity'])
+        return self._select('''
+            SELECT v.key, l.o AS title, NULL AS dbpDescription, sy.o AS symbol, t.o AS exchange, w.s AS dbpEntity, v.wdEntity
+            FROM vals v
+            JOIN triples w ON w.p = :sameAs AND w.o = v.wdEntity
+            JOIN triples l ON l.s = w.s AND l.p = :label AND l.lang = 'en'
+            JOIN triples c ON c.s = w.s AND c.p = :comment AND c.lang = 'en'
+            LEFT JOIN triples sy ON sy.s = w.s AND sy.p = :symbol AND EXISTS (SELECT 1 FROM triples e WHERE e.s = w.s AND e.p = :type)
+            LEFT JOIN triples t ON t.s = w.s AND t.p = :type AND sy.s IS NOT NULL
+        ''')
+
+    def q_categorised_entity(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Local q_categorised_entity, rows holds the 'key', 'exch' and 'wdEntity' of every cashtag."""
+
+        self._values(rows, ['key', 'exch', 'wdEntity'])
+        return self._select('''
+            SELECT v.key, l.o AS title, c.o AS dbpDescription, sy.o AS symbol, t.o AS exchange, w.s AS dbpEntity, v.wdEntity
+            FROM vals v
+            JOIN triples w ON w.p = :sameAs AND w.o = v.wdEntity
+            JOIN triples t ON t.s = w.s AND t.p = :type AND substr(t.o, -length(v.exch)) = v.exch
+            JOIN triples l ON l.s = w.s AND l.p = :label AND l.lang = 'en'
+            JOIN triples c ON c.s = w.s AND c.p = :comment AND c.lang = 'en'
+            LEFT JOIN triples sy ON sy.s = w.s AND sy.p = :symbol
+        ''')
+
+    def q_categorised_by_symbol(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Local q_categorised_by_symbol, rows holds the 'key', 'exch' and 'sym' of every cashtag."""
+
+        self._values(rows, ['key', 'exch', 'sym'])
+        return self._select('''
+            SELECT v.key, l.o AS title, c.o AS dbpDescription, sy.o AS symbol, t.o AS exchange, sy.s AS dbpEntity
+            FROM vals v
+            CROSS JOIN search sy ON sy.text LIKE '%' || v.sym || '%' AND sy.p = :symbol AND instr(sy.o, v.sym) > 0
+            JOIN triples t ON t.s = sy.s AND t.p = :type AND substr(t.o, -length(v.exch)) = v.exch
+            JOIN triples l ON l.s = sy.s AND l.p = :label AND l.lang = 'en'
+            JOIN triples c ON c.s = sy.s AND c.p = :comment AND c.lang = 'en'
+        ''')
+
+    def q_categorised_title(self, rows: pd.DataFrame, with_wikidata: bool=True) -> pd.DataFrame:
+        """Local q_categorised_title. As in the template, the lower cased English title has to
+        contain the label as given.
+
+        Args:
+            rows (pandas.DataFrame): 'key' and 'label' (lower case title) of every cashtag.
+            with_wikidata (bool): Require an owl:sameAs link to wikidata, as the batch template does.
+
+        """
+
+        self._values(rows, ['key', 'label'])
+        wikidata = '''
+            JOIN triples w ON w.s = l.s AND w.p = :sameAs AND substr(w.o, 1, length(:wikidata)) = :wikidata
+        ''' if with_wikidata else ''
+        return self._select('''
+            SELECT v.key, l.o AS title, c.o AS dbpDescription, sy.o AS symbol, t.o AS exchange, l.s AS dbpEntity{}
+            FROM vals v
+            CROSS JOIN search l ON l.text LIKE '%' || v.label || '%' AND l.p = :label AND l.lang = 'en' AND instr(l.text, v.label) > 0
+            JOIN triples t ON t.s = l.s AND t.p = :type AND +t.o IN (:nasdaq, :nyse)
+            JOIN triples c ON c.s = l.s AND c.p = :comment AND c.lang = 'en'
+            {}
+            LEFT JOIN triples sy ON sy.s = l.s AND sy.p = :symbol
+        '''.format(', w.o AS wdEntity' if with_wikidata else '', wikidata))
+
+    def q_title_tradedas(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Local q_title_tradedas, rows holds the 'key', 'label' (title) and 'exch' (dct:subject
+        fragment) of every cashtag. Virtuoso's bif:contains word search is approximated by a case
+        insensitive substring match, so a label also matches inside a longer word. Like the
+        template, labels of every language are searched, only the comment has to be English.
+
+        """
+
+        self._values(rows.assign(label=rows.label.str.lower()), ['key', 'label', 'exch'])
+        return self._select('''
+            SELECT v.key, l.s AS item, l.o AS title, su.o AS subject, c.o AS dbpDescription
+            FROM vals v
+            CROSS JOIN search l ON l.text LIKE '%' || v.label || '%' AND l.p = :label AND instr(l.text, v.label) > 0
+            JOIN triples su ON su.s = l.s AND su.p = :subject AND instr(su.o, v.exch) > 0
+            JOIN triples c ON c.s = l.s AND c.p = :comment AND c.lang = 'en'
+        ''')
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,131 @@
+from sklearn.datasets import dump_svmlight_file, load_svmlight_file
+
+import numpy as np
+import scipy.sparse
+
+import io
+import json
+import multiprocessing
+import os
+
+CHUNK_ROWS = 100000
+SIDECAR_ARRAYS = ['indptr', 'indices', 'data', 'y', 'shape']
+
+def sidecar_path(path) -> str:
+    return path+'.csr'
+
+def meta_path(path) -> str:
+    return path+'.meta.json'
+
+def n_features(path) -> int:
+    """Number of columns of the matrix written to path by dump_libfm, None if unknown."""
+
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f)['n_features']
+    except FileNotFoundError:
+        return None
+
+def _format_chunk(args) -> bytes:
+    X, y = args
+    buf = io.BytesIO()
+    dump_svmlight_file(X, y, buf, zero_based=True)
+    return buf.getvalue()
+
+def _dense_y(y) -> np.ndarray:
+    if scipy.sparse.issparse(y):
+        y = y.toarray()
+    return np.asarray(y, dtype=np.float64).ravel()
+
+def write_sidecar(X, y, path):
+    """Writes X and y as raw .npy arrays to the sidecar directory of path, from which they
+    can be memory-mapped back without parsing any text.
+
+    """
+
+    directory = sidecar_path(path)
+    os.makedirs(directory, exist_ok=True)
+    X = scipy.sparse.csr_matrix(X)
+    arrays = {
+        'indptr': X.indptr,
+        'indices': X.indices,
+        'data': X.data,
+        'y': _dense_y(y),
+        'shape': np.array(X.shape, dtype=np.int64)
+    }
+    for name in SIDECAR_ARRAYS:
+        # replaced rather than overwritten, arrays still memory-mapped from the old file stay valid
+        tmp_path = os.path.join(directory, name+'.npy.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arrays[name])
+        os.replace(tmp_path, os.path.join(directory, name+'.npy'))
+
+def read_sidecar(path, mmap: bool=True) -> tuple:
+    directory = sidecar_path(path)
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name+'.npy'), mmap_mode=mmap_mode) for name in SIDECAR_ARRAYS}
+    X = scipy.sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']), copy=False)
+    return X, arrays['y']
+
+def sidecar_is_fresh(path) -> bool:
+    """Whether the sidecar of path exists and was written after the text file."""
+
+    marker = os.path.join(sidecar_path(path), SIDECAR_ARRAYS[-1]+'.npy')
+    if not os.path.exists(marker):
+        return False
+    return not os.path.exists(path) or os.path.getmtime(marker) >= os.path.getmtime(path)
+
+def dump_libfm(X, y, path, workers: int=None, chunk_rows: int=CHUNK_ROWS, sidecar: bool=True):
+    """Writes X and y in svmlight/libfm text format, formatting row chunks in parallel.
+
+    The chunks are formatted by a pool of processes and written to path in order, so the
+    output is identical to a single dump_svmlight_file call. The number of columns is kept
+    in a small JSON file next to it, since the text format cannot tell trailing all zero
+    columns apart. Unless disabled, a binary CSR sidecar is written as well for load_libfm.
+
+    Args:
+        X (scipy.sparse.csr_matrix): Design matrix.
+        y (array-like): Targets, a column matrix is flattened.
+        path (str): Path of the text file.
+        workers (int): Number of processes formatting chunks.
+        chunk_rows (int): Rows per chunk.
+        sidecar (bool): Also write the binary CSR sidecar.
+
+    """
+
+    X = scipy.sparse.csr_matrix(X)
+    y = _dense_y(y)
+    workers = workers or multiprocessing.cpu_count()
+    chunks = ((X[i:i+chunk_rows], y[i:i+chunk_rows]) for i in range(0, X.shape[0], chunk_rows))
+
+    with open(path, 'wb') as f:
+        if workers > 1 and X.shape[0] > chunk_rows:
+            with multiprocessing.Pool(processes=workers) as pool:
+                for text in pool.imap(_format_chunk, chunks):
+                    f.write(text)
+        else:
+            for chunk in chunks:
+                f.write(_format_chunk(chunk))
+    with open(meta_path(path), 'w') as f:
+        json.dump({'n_features': X.shape[1]}, f)
+
+    if sidecar:
+        write_sidecar(X, y, path)
+
+def load_libfm(path, mmap: bool=True) -> tuple:
+    """Loads an svmlight/libfm file, from its binary sidecar when that is up to date.
+
+    A stale or missing sidecar is (re)written after parsing the text file, so only the first
+    load after the text file changes pays for parsing it. The text is parsed with the zero
+    based indices and the number of columns dump_libfm wrote it with.
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, numpy.ndarray), like load_svmlight_file.
+
+    """
+
+    if sidecar_is_fresh(path):
+        return read_sidecar(path, mmap=mmap)
+    X, y = load_svmlight_file(path, n_features=n_features(path), zero_based=True)
+    write_sidecar(X, y, path)
+    return X, y
@@ -1,23 +1,25 @@
 from datetime import datetime
-from SPARQLWrapper import SPARQLWrapper, JSON
 
 from utils.queries import queryFormatter
-from Levenshtein import _levenshtein
+from sparql import AsyncSPARQL, ENDPOINTS, QueryCache
+from fuzzy import FuzzyJoin, drop_worse_matches, ratios
+from kb import KnowledgeBase
+from sink import ResultSink
 from termcolor import colored
 
 import pandas as pd
-import more_itertools as mit
 
 import logging
 import sys
-import time
 import os
 import re
 import codecs, difflib
 import math
 
 class Queryer:
-    def __init__(self, source='dbpedia', query_type='q_entity', query_rate='individual'):
+    def __init__(self, source='dbpedia', query_type='q_entity', query_rate='individual', endpoints: dict=None, rate: float=5.0, concurrency: int=4,
+                 cache: bool=True, offline: bool=False, ttl: float=None, cache_bytes: int=None, kb: str=None, kb_source: str=None,
+                 resume: bool=False, title_threshold: float=1.0):
         def wikidata():
             try:
                 self.results = pd.read_csv(self._rpath+'tag_cat_results.csv', sep='\t')
@@ -39,13 +41,29 @@ class Queryer:
         self._logpath = '../log/database/dbquery'
         self._rpath = '../data/csv/'
         self._wpath = '../data/txt/queryer/levenshtein/'
+        self._cpath = '../data/cache/sparql/'
+        self._spath = '../data/cache/results/'
         self.source = source
         self.query_type = query_type
         self.query_rate = query_rate
+        # resumed runs keep the results sinks of the previous run and skip the keys they completed
+        self.resume = resume
+        # minimum Levenshtein ratio of a result title to the title of a cashtag not found, the
+        # default only admits exact matches
+        self.title_threshold = title_threshold
+        self.endpoints = dict(ENDPOINTS, **(endpoints or {}))
+        # offline mode answers from the cache only, queries without a cached answer return None
+        self.cache = QueryCache(self._cpath, ttl=ttl, max_bytes=cache_bytes, offline=offline) if cache or offline else None
+        self.clients = {k: AsyncSPARQL(url, rate=rate, concurrency=concurrency, cache=self.cache) for k, url in self.endpoints.items()}
+        # local knowledge base answering the dbpedia templates instead of the endpoint
+        self.kb = KnowledgeBase(kb) if kb else None
+        if self.kb is not None and kb_source and not self.kb.exists():
+            self.kb.load(kb_source)
 
         locals()[self.source.lower()]()
 
         self.not_found = pd.DataFrame()
+        self._tickers = None
 
     def logger(self):
         """Sets logger config to both std.out and log ./log/io/dbquery
@@ -66,16 +84,92 @@ class Queryer:
                 logging.StreamHandler(sys.stdout)
             ])
 
+    def _endpoint_query(self, symbols: str, keyword: str) -> tuple:
+        if keyword == 'dbpedia':
+            return 'dbpedia', symbols
+        return 'wikidata', queryFormatter(keyword, symbols)
+
     def run_query(self, symbols: str, keyword: str):
-        if keyword is 'dbpedia':
-            sparql = SPARQLWrapper("http://dbpedia.org/sparql")
-            query = symbols
+        endpoint, query = self._endpoint_query(symbols, keyword)
+        return self._to_frame(self.clients[endpoint].run(query), keyword)
+
+    def sink(self, name: str) -> ResultSink:
+        """On-disk sink for the results of the named loop, emptied unless the run is resumed."""
+
+        sink = ResultSink(os.path.join(self._spath, name))
+        if not self.resume:
+            sink.clear()
+        elif sink.done:
+            print("Resuming {}, {} keys already completed".format(name, len(sink.done)))
+        return sink
+
+    def run_queries(self, queries: list, keyword: str, sink: ResultSink=None, keys: list=None) -> pd.DataFrame:
+        """Concurrent equivalent of run_query over a list of queries (or symbol strings).
+
+        Args:
+            queries (list): Queries, or symbol strings of a wikidata query.
+            keyword (str): 'dbpedia', or the wikidata query type of run_query.
+            sink (ResultSink): Receives the results of every query as soon as it is answered,
+                kept in memory if None.
+            keys (list): Key checkpointed in the sink per query once it is answered.
+
+        Returns:
+            pandas.DataFrame: Results of all queries in the sink, compacted.
+
+        """
+
+        sink = sink or ResultSink()
+        prepared = [self._endpoint_query(q, keyword) for q in queries]
+        endpoint = prepared[0][0] if prepared else 'dbpedia'
+        index = dict(zip([q for _, q in prepared], keys or []))
+
+        def on_answer(query, response):
+            # offline cache misses are not completed
+            completed = [index[query]] if query in index and response is not None else None
+            sink.append(self._to_frame(response, keyword), completed)
+
+        # flushed even if the run dies, so a resumed run skips whatever was answered
+        with sink:
+            self.clients[endpoint].run_all([q for _, q in prepared], on_answer)
+        sink.compact()
+        return sink.frame()
+
+    def run_batched(self, values: list, template: str, keyword: str, sink: ResultSink=None, keys: list=None) -> pd.DataFrame:
+        """Queries values in batches sized adaptively per endpoint.
+
+        Args:
+            values (list): VALUES rows of a dbpedia query, or symbol patterns of a wikidata query.
+            template (str): dbpedia query with a single {} for the VALUES rows, unused for wikidata.
+            keyword (str): 'dbpedia', or the wikidata query type of run_query.
+            sink (ResultSink): Receives the results of every batch as soon as it is answered,
+                kept in memory if None.
+            keys (list): Key checkpointed in the sink per value once its batch is answered.
+
+        Returns:
+            pandas.DataFrame: Results of all batches in the sink, compacted.
+
+        """
+
+        if keyword == 'dbpedia':
+            endpoint = 'dbpedia'
+            build = lambda batch: template.format(''.join(batch))
         else:
-            sparql = SPARQLWrapper("https://query.wikidata.org/sparql")
-            query = queryFormatter(keyword, symbols)
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
+            endpoint = 'wikidata'
+            build = lambda batch: queryFormatter(keyword, '|'.join(batch))
+        sink = sink or ResultSink()
+        index = dict(zip(values, keys or []))
+
+        def on_answer(batch, response):
+            completed = [index[v] for v in batch if v in index] if response is not None else None
+            sink.append(self._to_frame(response, keyword), completed)
+
+        with sink:
+            self.clients[endpoint].run_batched(values, build, on_answer=on_answer)
+        sink.compact()
+        return sink.frame()
+
+    def _to_frame(self, results: dict, keyword: str):
+        if results is None: return None
         results_df = pd.DataFrame()
 
         try:
@@ -102,149 +196,127 @@ class Queryer:
     def dbp_symbols_query_gen(self):
 
         def q_entity(symbols: list):
-            results = pd.DataFrame()
-            for i, s in enumerate(symbols):
+            values = []
+            for s in symbols:
                 s_members = s.split('|')
                 exchange_symbol_string = ''.join(s_members[:-2])
                 wd_sym_link = s_members[2]
-                value = """( "{}" <{}>) """.format(exchange_symbol_string, wd_sym_link)
-                print("Parsing symbol: {}, List: {}/{}".format(exchange_symbol_string, i+1, len(symbols)))
-                query = """
-                    PREFIX yago: <http://dbpedia.org/class/yago/>
-                    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-                    SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
-                    WHERE {{
-                        ?dbpEntity rdfs:label ?title.
-                        ?dbpEntity rdfs:comment ?comment.
-                        OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol . ?dbpEntity rdf:type ?exchange.}}
-                        ?dbpEntity owl:sameAs ?wdEntity.
-                        FILTER (lang(?title) = "en" && lang(?comment) = "en").
-                        VALUES ( ?key ?wdEntity ) 
-                            {{ {} }}
-                    }}
-                    """.format(value)
-                results_df = self.run_query(query, 'dbpedia')
-                results = results.append(results_df, ignore_index = True) 
-                time.sleep(0.2)
-            return results
+                values.append("""( "{}" <{}>) """.format(exchange_symbol_string, wd_sym_link))
+            print("Parsing symbol list of size: {}".format(len(values)))
+            query = """
+                PREFIX yago: <http://dbpedia.org/class/yago/>
+                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+                SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
+                WHERE {{
+                    ?dbpEntity rdfs:label ?title.
+                    ?dbpEntity rdfs:comment ?comment.
+                    OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol . ?dbpEntity rdf:type ?exchange.}}
+                    ?dbpEntity owl:sameAs ?wdEntity.
+                    FILTER (lang(?title) = "en" && lang(?comment) = "en").
+                    VALUES ( ?key ?wdEntity ) 
+                        {{ {} }}
+                }}
+                """
+            return self.run_batched(values, query, 'dbpedia', sink, keys)
 
         def q_categorised_entity(symbols: list):
-            results = pd.DataFrame()
-            symbols_split = [list(c) for c in mit.divide(512, symbols)]
-            for i, split in enumerate(symbols_split):
-                print("Parsing symbol list of size: {}, List: {}/{}".format(len(split), i+1, len(symbols_split)))
-                values = []
-                for s in split:
-                    s_members = s.split('|')
-                    exchange_symbol_string = ''.join(s_members[:-2])
-                    exchange = s_members[0]
-                    wd_sym_link = s_members[2]
-                    values.append("""( "{}" "{}" <{}>) """.format(exchange_symbol_string, exchange, wd_sym_link))
-                values = ''.join(values)
+            values = []
+            for s in symbols:
+                s_members = s.split('|')
+                exchange_symbol_string = ''.join(s_members[:-2])
+                exchange = s_members[0]
+                wd_sym_link = s_members[2]
+                values.append("""( "{}" "{}" <{}>) """.format(exchange_symbol_string, exchange, wd_sym_link))
+            print("Parsing symbol list of size: {}".format(len(values)))
 
-                #FILTER(?exchange IN (yago:WikicatCompaniesListedOnNASDAQ,yago:WikicatCompaniesListedOnTheNewYorkStockExchange))
-                query = """
-                    PREFIX yago: <http://dbpedia.org/class/yago/>
-                    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-                    SELECT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
-                    WHERE {{
-                        ?dbpEntity rdfs:label ?title.
-                        ?dbpEntity rdfs:comment ?comment.
-                        OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol . }}
-                        ?dbpEntity rdf:type ?exchange.
-                        ?dbpEntity owl:sameAs ?wdEntity.
-                        FILTER (lang(?title) = "en" && lang(?comment) = "en").
-                        FILTER(STRENDS(STR(?exchange),?exch))
-                        VALUES ( ?key ?exch ?wdEntity ) 
-                            {{ {} }}
-                    }}
-                    """.format(values)
-
-                results_df = self.run_query(query, 'dbpedia')
-                results = results.append(results_df, ignore_index = True) 
-                time.sleep(1)
-            return results
+            #FILTER(?exchange IN (yago:WikicatCompaniesListedOnNASDAQ,yago:WikicatCompaniesListedOnTheNewYorkStockExchange))
+            query = """
+                PREFIX yago: <http://dbpedia.org/class/yago/>
+                PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+                PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+                SELECT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
+                WHERE {{
+                    ?dbpEntity rdfs:label ?title.
+                    ?dbpEntity rdfs:comment ?comment.
+                    OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol . }}
+                    ?dbpEntity rdf:type ?exchange.
+                    ?dbpEntity owl:sameAs ?wdEntity.
+                    FILTER (lang(?title) = "en" && lang(?comment) = "en").
+                    FILTER(STRENDS(STR(?exchange),?exch))
+                    VALUES ( ?key ?exch ?wdEntity ) 
+                        {{ {} }}
+                }}
+                """
+            return self.run_batched(values, query, 'dbpedia', sink, keys)
 
         def q_categorised_by_symbol(symbols: list):
-            results = pd.DataFrame()
-            for i, s in enumerate(symbols):
+            values = []
+            for s in symbols:
                 s_members = s.split('|')
                 exchange, symbol = s_members[:-2]
                 exchange_symbol_string = ''.join(s_members[:-2])
-                value = """( "{}" "{}" "{}") """.format(exchange_symbol_string, exchange, symbol)
-                print("Parsing symbol: {}, List: {}/{}".format(exchange_symbol_string, i+1, len(symbols)))
-            
-                query = """
-                            PREFIX yago: <http://dbpedia.org/class/yago/>
-                            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                            PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-                            SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity
-                            WHERE {{
-                                ?dbpEntity rdfs:label ?title.
-                                ?dbpEntity rdfs:comment ?dbpDescription.
-                                ?dbpEntity dbp:symbol ?symbol .
-                                ?dbpEntity rdf:type ?exchange.
-                                FILTER (lang(?title) = "en" && lang(?dbpDescription) = "en" && contains(str(?symbol),?sym))
-                                FILTER(STRENDS(STR(?exchange),?exch))
-                                VALUES ( ?key ?exch ?sym  ) 
-                                    {{ {} }}
-                            }}
-                            """.format(value)
-                        
-                results_df = self.run_query(query, 'dbpedia')
-                results = results.append(results_df, ignore_index = True) 
-                time.sleep(0.2)
-            return results
+                values.append("""( "{}" "{}" "{}") """.format(exchange_symbol_string, exchange, symbol))
+            print("Parsing symbol list of size: {}".format(len(values)))
+
+            query = """
+                        PREFIX yago: <http://dbpedia.org/class/yago/>
+                        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+                        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                        PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+                        SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity
+                        WHERE {{
+                            ?dbpEntity rdfs:label ?title.
+                            ?dbpEntity rdfs:comment ?dbpDescription.
+                            ?dbpEntity dbp:symbol ?symbol .
+                            ?dbpEntity rdf:type ?exchange.
+                            FILTER (lang(?title) = "en" && lang(?dbpDescription) = "en" && contains(str(?symbol),?sym))
+                            FILTER(STRENDS(STR(?exchange),?exch))
+                            VALUES ( ?key ?exch ?sym  ) 
+                                {{ {} }}
+                        }}
+                        """
+            return self.run_batched(values, query, 'dbpedia', sink, keys)
 
         def q_categorised_title(symbols: list):
             def batch():
-                results = pd.DataFrame()
-                symbols_split = [list(c) for c in mit.divide(5, symbols)]
-                for i, split in enumerate(symbols_split):
-                    print("Parsing symbol list of size: {}, List: {}/{}".format(len(split), i+1, len(symbols_split)))
-                    values = []
-                    for s in split:
-                        s_members = s.split('|')
-                        exchange_symbol_string = ''.join(s_members[:-2])
-                        exchange = s_members[0]
-                        title = s_members[3]
-                        values.append("""( "{}" "{}") """.format(exchange_symbol_string, title))
-                    values = ''.join(values)
-                        
-                    query = """
-                            PREFIX yago: <http://dbpedia.org/class/yago/>
-                            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                            PREFIX owl: <http://www.w3.org/2002/07/owl#>
+                values = []
+                for s in symbols:
+                    s_members = s.split('|')
+                    exchange_symbol_string = ''.join(s_members[:-2])
+                    exchange = s_members[0]
+                    title = s_members[3]
+                    values.append("""( "{}" "{}") """.format(exchange_symbol_string, title))
+                print("Parsing symbol list of size: {}".format(len(values)))
 
-                            SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
-                            WHERE {{
-                                ?dbpEntity rdfs:label ?title.
-                                ?dbpEntity rdfs:comment ?dbpDescription.
-                                OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol .}}
-                                ?dbpEntity owl:sameAs ?wdEntity.
-                                ?dbpEntity rdf:type ?exchange.
-                                FILTER (lang(?title) = "en" && lang(?dbpDescription) = "en" && contains(lcase(?title),?label) && strstarts(str(?wdEntity),"http://www.wikidata.org/entity/")).
-                                FILTER(?exchange IN (yago:WikicatCompaniesListedOnNASDAQ,yago:WikicatCompaniesListedOnTheNewYorkStockExchange))
-                                VALUES ( ?key ?label ) 
-                                    {{ {} }}
-                            }}
-                            """.format(values)
-                    results_df = self.run_query(query, 'dbpedia')
-                    results = results.append(results_df, ignore_index = True) 
-                    time.sleep(0.5)
-                return results
+                query = """
+                        PREFIX yago: <http://dbpedia.org/class/yago/>
+                        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+                        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                        PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+                        SELECT DISTINCT ?key ?title ?dbpDescription ?symbol ?exchange ?dbpEntity ?wdEntity
+                        WHERE {{
+                            ?dbpEntity rdfs:label ?title.
+                            ?dbpEntity rdfs:comment ?dbpDescription.
+                            OPTIONAL {{ ?dbpEntity dbp:symbol ?symbol .}}
+                            ?dbpEntity owl:sameAs ?wdEntity.
+                            ?dbpEntity rdf:type ?exchange.
+                            FILTER (lang(?title) = "en" && lang(?dbpDescription) = "en" && contains(lcase(?title),?label) && strstarts(str(?wdEntity),"http://www.wikidata.org/entity/")).
+                            FILTER(?exchange IN (yago:WikicatCompaniesListedOnNASDAQ,yago:WikicatCompaniesListedOnTheNewYorkStockExchange))
+                            VALUES ( ?key ?label ) 
+                                {{ {} }}
+                        }}
+                        """
+                return self.run_batched(values, query, 'dbpedia', sink, keys)
 
             def individual():
-                results = pd.DataFrame()
+                queries = []
                 for i, s in enumerate(symbols):
                     s_members = s.split('|')
                     exchange, symbol = s_members[:-2]
@@ -272,16 +344,14 @@ class Queryer:
                                     {{ {} }}
                             }}
                             """.format(value)
-                    results_df = self.run_query(query, 'dbpedia')
-                    results = results.append(results_df, ignore_index = True)
-                    time.sleep(0.15)
-                return results
+                    queries.append(query)
+                return self.run_queries(queries, 'dbpedia', sink, keys)
 
             results = locals()[self.query_rate.lower()]()
             return results
 
         def q_title_tradedas(symbols: str):
-            results = pd.DataFrame()
+            queries = []
             for i, s in enumerate(symbols):
                 s_members = s.split('|')
                 exchange, symbol = s_members[:-2]
@@ -325,88 +395,90 @@ class Queryer:
                                 VALUES (?key) {{ ("{}") }}
                                 }}
                 """.format(title, exchange, exchange_symbol_string)
-                results_df = self.run_query(query, 'dbpedia')
-                results = results.append(results_df, ignore_index = True)
-                time.sleep(0.15)
-            return results
+                queries.append(query)
+            return self.run_queries(queries, 'dbpedia', sink, keys)
 
         symbols = []
         for _, row in self.not_found.iterrows():
             symbol = row.exchange+'|'+row.symbol+'|'+str(row.wdEntity)+'|'+row.title
             symbols.append(symbol)
 
-        results = locals()[self.query_type.lower()](symbols)
+        sink = self.sink(self.query_type)
+        symbols = [s for s in symbols if ''.join(s.split('|')[:2]) not in sink.done]
+        keys = [''.join(s.split('|')[:2]) for s in symbols]
+        if self.kb is not None:
+            # through the sink, so the results of keys completed by an earlier run are kept
+            sink.append(self.kb_query_gen(symbols), keys)
+            sink.compact()
+            results = sink.frame()
+        else:
+            results = locals()[self.query_type.lower()](symbols)
             
         print("Size of results returned: {}".format(results.shape[0]))
         return results
 
+    def kb_query_gen(self, symbols: list) -> pd.DataFrame:
+        """Resolves all symbols at once against the local knowledge base, with the query type of
+        dbp_symbols_query_gen.
+
+        """
+
+        members = pd.Series(symbols, dtype=object).str.split('|', n=3, expand=True)
+        rows = pd.DataFrame({'exch': members[0], 'sym': members[1], 'wdEntity': members[2], 'label': members[3]})
+        rows['key'] = rows.exch+rows.sym
+
+        if self.query_type == 'q_categorised_title':
+            return self.kb.q_categorised_title(rows, with_wikidata=self.query_rate == 'batch')
+        if self.query_type == 'q_title_tradedas':
+            rows['label'] = rows.label.where(~rows.label.str.endswith('co'), rows.label.str.replace(' co', ''))
+            rows['exch'] = rows.exch.replace('NYSE', 'New_York_Stock_Exchange')
+        return getattr(self.kb, self.query_type)(rows)
+
     def query_loop(self, df: pd.DataFrame, query: str):
         if query is 'standard':
             symbols = ['^'+s+'$' for s in df.symbol.tolist()]
         elif query is 'by_name':
             symbols = [str(s).strip() for s in df.title.tolist()]
             symbols = [re.sub(' +', ' ', s) for s in symbols]
-        symbols_split = [list(c) for c in mit.divide(8, symbols)]
-
-        results = pd.DataFrame()
-        for i, s in enumerate(symbols_split):
-            print("Parsing symbol list of size: {}, List: {}/{}".format(len(s), i+1, len(symbols_split)))
-            symbols = '|'.join(s)
-            query_results = self.run_query(symbols, query)
-            results = results.append(query_results)
+        print("Parsing symbol list of size: {}".format(len(symbols)))
+        sink = self.sink(query)
+        symbols = [s for s in symbols if s not in sink.done]
+        results = self.run_batched(symbols, None, query, sink, symbols)
         print("Size of results returned: {}".format(results.shape[0]))
         return results
 
     def merge_and_remove_duplicates(self, merge_on, variables):
-        def clean_duplicates(df):
-            maxes = {}
-            for i, row in df.iterrows():
-                lev = _levenshtein.ratio(row.title_x, row.title_y)
-                if row.title_x not in maxes:
-                    maxes[row.title_x] = (i, lev)
-                else:
-                    if lev > maxes[row.title_x][1]:
-                        maxes[row.title_x] = (i, lev)
-            maxes = [val[0] for val in maxes.values()]
-            indexes = df.index.values.tolist()
-            return list(set(indexes) - set(maxes))
-
         self.df = self.df.merge(self.results, on=merge_on, how='left')
-        duplicate_df = pd.concat(g for _, g in self.df.groupby(merge_on[0]) if len(g) > 1)
         if 'symbol' in merge_on:
-            duplicate_df = duplicate_df[['title_x', 'title_y']]
-            indexes = clean_duplicates(duplicate_df)
-            self.df = self.df.drop(self.df.index[indexes])
+            self.df = drop_worse_matches(self.df, [merge_on[0]], 'title_x', 'title_x', 'title_y')
         for v in variables:
             self.df[v] = self.df[v+'_x'].where(self.df[v+'_y'].isnull(), self.df[v+'_y'])
             if 'symbol' in merge_on:
                 cols = list(self.df)
                 cols.insert(1, cols.pop(cols.index('title')))
-                self.df = self.df.ix[:, cols]
+                self.df = self.df.loc[:, cols]
             self.df = self.df.drop(columns=[v+'_x', v+'_y'])
         if 'title' in merge_on: self.df = self.df.drop_duplicates(subset=['symbol', 'exchange'])
 
+    def tickers(self) -> pd.DataFrame:
+        """SEC ticker reference table, read once and keyed by its first row per ticker."""
+
+        if self._tickers is None:
+            tickers = pd.read_csv('./utils/secwiki_tickers.csv')
+            self._tickers = tickers.drop_duplicates(subset='Ticker')[['Ticker', 'Name']].dropna(subset=['Name'])
+        return self._tickers
+
     def dbpedia_cleaner(self):
         def levenshtein_comparison(df):
-            results = pd.DataFrame()
-            tickers = pd.read_csv('./utils/secwiki_tickers.csv')
-            rows = {}
-            for _, row in df.iterrows():
-                if row.key == "NASDAQ|FBMS": continue
-                match_col = tickers.loc[tickers['Ticker'] == row.symbol]
-                if not match_col.empty and not pd.isna(match_col.Name.values[0]):
-                    lev = _levenshtein.ratio(row.title, match_col.Name.values[0])
-                    if lev > 0.55:
-                        if row.key in rows and lev > rows[row.key][1]:
-                            rows[row.key] = [row, lev]
-                        else:
-                            rows[row.key] = [row,lev]
-                        print(row.dbpDescription[:50], row.key, row.title, colored("MATCH", "blue"), match_col.Name.values[0], match_col.Ticker.values[0], lev)
-            for _, v in rows.items():
-                results = results.append(v[0], ignore_index = True)
-            #print(results[['dbpDescription', 'exchange', 'key', 'symbol', 'title']])
-            sys.exit(0)
-            return results
+            df = df[df.key != "NASDAQ|FBMS"]
+            df = df.merge(self.tickers(), left_on='symbol', right_on='Ticker', how='inner')
+            df['lev'] = ratios(df.title, df.Name)
+            df = df[df.lev > 0.55]
+            for row in df.itertuples():
+                print(str(row.dbpDescription)[:50], row.key, row.title, colored("MATCH", "blue"), row.Name, row.Ticker, row.lev)
+            # best match per key
+            df = df.sort_values('lev', kind='mergesort').drop_duplicates(subset='key', keep='last')
+            return df.drop(columns=['Ticker', 'Name', 'lev'])
 
         self.results = pd.read_csv(self._rpath+'tag_cat_results_new.csv', sep='\t')
         # self.df = self.df.rename(columns={
@@ -422,33 +494,28 @@ class Queryer:
         #     self.df.at[i, 'keep'] = row.wdExchange.endswith(row.exchange)
         # self.df = self.df[self.df['keep']]
         self.df = levenshtein_comparison(self.df)
-        for i, row in self.results.iterrows():
-            match_row = self.df.loc[self.df['symbol'] == row.symbol]
-            
-            if not match_row.empty and pd.isna(row.dbpEntity):
-                if 'wdEntity' in self.df.index and pd.isna(match_row.wdEntity.values[0]):
-                    self.results.at[i, 'wdEntity'] = match_row.wdEntity.values[0]
-                self.results.at[i, 'dbpEntity'], self.results.at[i, 'dbpDescription'] = match_row.item.values[0], match_row.dbpDescription.values[0]
+
+        # levenshtein_comparison orders the keys by ascending ratio, so the last key of a symbol
+        # listed on more than one exchange is its best match
+        matches = self.df.drop_duplicates(subset='symbol', keep='last').set_index('symbol')
+        missing = self.results.dbpEntity.isna() & self.results.symbol.isin(matches.index)
+        matched = matches.loc[self.results.loc[missing, 'symbol']]
+        if 'wdEntity' in matches and 'wdEntity' in self.results:
+            no_wd = missing & self.results.wdEntity.isna()
+            self.results.loc[no_wd, 'wdEntity'] = matches.loc[self.results.loc[no_wd, 'symbol'], 'wdEntity'].values
+        self.results.loc[missing, 'dbpEntity'] = matched['item'].values
+        self.results.loc[missing, 'dbpDescription'] = matched['dbpDescription'].values
 
     def clean_results(self, df: pd.DataFrame, keyword: str):
         def levenshtein_comparison(results_df: pd.DataFrame):
             print("Size of result_df: {}".format(results_df.shape[0]))
             cashtags_not_found = self.not_found['title'].tolist()
-            results_df['keep'] = False
-            match_count = 0
-            for i, row in results_df.iterrows():
-                curr_title = row['title'].lower()
-                ratios = {}
-                for tag_not_found in cashtags_not_found:
-                    # lev = difflib.SequenceMatcher(None, tag, title).ratio()
-                    lev = _levenshtein.ratio(curr_title, tag_not_found)
-                    ratios[tag_not_found] = lev
-                matched_string = max(ratios, key=lambda key: ratios[key])
-                matched_ratio = ratios[matched_string]
-                if matched_ratio == 1.0:
-                    results_df.at[i, 'keep'], match_count = True, match_count+1
-            results_df = results_df[results_df.keep]
-            results_df = results_df.drop(columns=['keep'])
+            # the closest title of a cashtag not found is kept next to the result's own title,
+            # results without a close enough title are dropped
+            matches = FuzzyJoin(cashtags_not_found, threshold=self.title_threshold).match(results_df['title'].str.lower())
+            keep = matches['match'].notna().values
+            results_df = results_df[keep].copy()
+            results_df['matched_title'] = matches['match'].values[keep]
             print("Size of result_df: {}".format(results_df.shape[0]))
             return results_df
 
@@ -481,6 +548,9 @@ class Queryer:
             print("Remaining symbols: {}".format(self.not_found.shape[0]))
             self.results = self.query_loop(self.not_found, 'by_name')
             self.results = self.clean_results(self.results, 'match_names')
+            # results merge onto the cashtag title they matched, which is their own title
+            # unless title_threshold admits fuzzy matches
+            self.results = self.results.drop(columns='title').rename(columns={'matched_title': 'title'})
             self.merge_and_remove_duplicates(['title', 'exchange'], ['wdDescription', 'wdEntity'])
             self.df.to_csv(self._rpath+'tag_cat_results.csv', sep="\t", index=False)
             print("Items with wikidata entries: {}".format(self.df[~self.df.wdEntity.isna()].shape[0]))
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+import multiprocessing
+
+MIN_ACCEPTANCE = 0.05
+
+class NegativeSampler:
+    """Batched negative sampler over integer coded user/cashtag interactions.
+
+    The positives of every user are kept as a sorted set of cashtag codes, laid out
+    CSR-style (self.indptr into self.positives) and as one globally sorted array of
+    user*n_tags+tag keys, so membership of a whole batch of candidates is a single
+    numpy.searchsorted. Candidates are drawn in batches for all users at once,
+    positives are rejected and the draw is repeated only for users still short of
+    negatives. Users are sharded across worker processes.
+
+    Attributes:
+        ratio (int): Negatives drawn per positive interaction.
+        method (str): 'uniform' over cashtags, or 'popularity' weighted by the number of
+            interactions of each cashtag.
+        seed (int): Seed of the random generators, worker i uses seed+i.
+        workers (int): Number of processes users are sharded across.
+        max_rounds (int): Rejection rounds before a user's remaining deficit is given up on.
+
+    """
+
+    def __init__(self, users, tags, ratio: int=2, method: str='popularity', seed: int=1, workers: int=None, max_rounds: int=20):
+        self.ratio = ratio
+        self.method = method
+        self.seed = seed
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_rounds = max_rounds
+
+        user_codes, self.user_ids = pd.factorize(np.asarray(users))
+        tag_codes, self.tag_ids = pd.factorize(np.asarray(tags))
+        self.n_users, self.n_tags = len(self.user_ids), len(self.tag_ids)
+
+        self.keys = np.unique(user_codes.astype(np.int64)*self.n_tags+tag_codes)
+        self.positives = self.keys % self.n_tags
+        self.indptr = np.searchsorted(self.keys // self.n_tags, np.arange(self.n_users+1))
+
+        self.needed = np.bincount(user_codes, minlength=self.n_users)*self.ratio
+        popularity = np.bincount(tag_codes, minlength=self.n_tags).astype(np.float64)
+        self.p = popularity/popularity.sum() if method == 'popularity' else None
+
+        # probability of a single draw not hitting one of the user's positives
+        weights = self.p[self.positives] if self.p is not None else np.full(self.positives.shape[0], 1/self.n_tags)
+        self.acceptance = 1-np.bincount(self.keys // self.n_tags, weights=weights, minlength=self.n_users)
+
+    def _is_positive(self, users, tags) -> np.ndarray:
+        keys = users.astype(np.int64)*self.n_tags+tags
+        idx = np.minimum(np.searchsorted(self.keys, keys), len(self.keys)-1)
+        return self.keys[idx] == keys
+
+    def _sample_users(self, users, seed) -> tuple:
+        """Draws the negatives of a shard of user codes.
+
+        Returns:
+            tuple: (user codes, tag codes) of the negatives and the codes of users dropped
+                because they interacted with every cashtag.
+
+        """
+
+        rng = np.random.default_rng(seed)
+        out_users, out_tags = [], []
+
+        # users who interacted with nearly every cashtag would be rejected almost every draw,
+        # their negatives are drawn directly from the complement of their positives instead
+        saturated = users[self.acceptance[users] < MIN_ACCEPTANCE]
+        users = users[self.acceptance[users] >= MIN_ACCEPTANCE]
+        dropped = []
+        for u in saturated:
+            complement = np.setdiff1d(np.arange(self.n_tags), self.positives[self.indptr[u]:self.indptr[u+1]], assume_unique=True)
+            p = self.p[complement]/self.p[complement].sum() if self.p is not None and self.p[complement].sum() > 0 else None
+            if complement.shape[0] == 0:
+                dropped.append(u)
+                continue
+            out_tags.append(rng.choice(complement, size=self.needed[u], p=p))
+            out_users.append(np.full(self.needed[u], u))
+        dropped = np.array(dropped, dtype=np.int64)
+        remaining = self.needed[users].copy()
+
+        for _ in range(self.max_rounds):
+            active = remaining > 0
+            if not active.any():
+                break
+            users, remaining = users[active], remaining[active]
+
+            # over-draw by the expected rejection rate of each user, so that most users are
+            # done after a single round
+            draws = np.ceil(1.2*remaining/self.acceptance[users]).astype(np.int64)+1
+            cand_users = np.repeat(users, draws)
+            cand_tags = rng.choice(self.n_tags, size=cand_users.shape[0], p=self.p)
+
+            accepted = ~self._is_positive(cand_users, cand_tags)
+            cand_users, cand_tags = cand_users[accepted], cand_tags[accepted]
+
+            # keep at most the remaining number of negatives per user, candidates are grouped by user
+            pos = np.searchsorted(users, cand_users)
+            counts = np.bincount(pos, minlength=users.shape[0])
+            rank = np.arange(cand_users.shape[0])-(np.cumsum(counts)-counts)[pos]
+            keep = rank < remaining[pos]
+            out_users.append(cand_users[keep])
+            out_tags.append(cand_tags[keep])
+            remaining = remaining-np.minimum(counts, remaining)
+
+        dropped = np.concatenate([dropped, users[remaining > 0]])
+        if not out_users:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), dropped
+        return np.concatenate(out_users), np.concatenate(out_tags), dropped
+
+    def sample(self) -> tuple:
+        """Draws self.ratio negatives for every positive interaction.
+
+        Returns:
+            tuple: (numpy.ndarray, numpy.ndarray, numpy.ndarray), user ids and cashtag ids of
+                the negatives, and the ids of users for which not enough negatives exist.
+
+        """
+
+        shards = np.array_split(np.arange(self.n_users), self.workers)
+        args = [(shard, self.seed+i) for i, shard in enumerate(shards)]
+        if self.workers > 1:
+            with multiprocessing.Pool(processes=self.workers) as pool:
+                results = pool.starmap(self._sample_users, args)
+        else:
+            results = [self._sample_users(*a) for a in args]
+
+        users = np.concatenate([r[0] for r in results])
+        tags = np.concatenate([r[1] for r in results])
+        dropped = np.concatenate([r[2] for r in results])
+        return self.user_ids[users], self.tag_ids[tags], self.user_ids[dropped]
@@ -0,0 +1,157 @@
+import pandas as pd
+
+import json
+import os
+import shutil
+
+class ResultSink:
+    """Append-only, on-disk table for the results of long query and parse loops.
+
+    Instead of growing a frame with every batch of results, which copies it each time, the
+    batches are buffered and flushed to a new tab separated part file once flush_rows rows have
+    accumulated. The parts are only concatenated, once, when the frame is requested, so time and
+    memory stay linear in the number of results and everything flushed survives a crash.
+
+    A batch can be appended together with the keys (eg. cashtags) it completes. The keys are
+    checkpointed with the part holding their results, so after an interruption done gives the
+    keys whose results are safely on disk and a resumed run only has to query the others.
+
+    Layout of a sink directory:
+        meta.json: Row count, next part number and the names, sizes and completed keys of the
+            parts, in order.
+        part-<n>.tsv: One file per flush, a part without rows only records keys.
+
+    Attributes:
+        path (str): Directory holding the sink, the batches are only buffered in memory if None.
+        flush_rows (int): Buffered rows which trigger a flush.
+        flush_keys (int): Buffered completed keys which trigger a flush.
+
+    """
+
+    def __init__(self, path=None, flush_rows: int=10000, flush_keys: int=100):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_keys = flush_keys
+        self.buffer = []
+        self.buffered = 0
+        self.keys = []
+
+        self._meta_path = os.path.join(self.path, 'meta.json') if self.path else None
+        self.meta = self._read_meta()
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, TypeError):
+            return {'rows': 0, 'next': 0, 'parts': []}
+
+    def _write_meta(self):
+        tmp_path = self._meta_path+'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    @property
+    def rows(self) -> int:
+        return self.meta['rows']+self.buffered
+
+    @property
+    def done(self) -> set:
+        """Keys completed by the flushed parts."""
+
+        return {k for part in self.meta['parts'] for k in part.get('keys', [])}
+
+    def append(self, df: pd.DataFrame, keys: list=None):
+        """Buffers a batch of results, flushing the buffer once it holds flush_rows rows or
+        flush_keys completed keys.
+
+        Args:
+            df (pandas.DataFrame): Results of one batch, None or empty frames add no rows.
+            keys (list): Keys completed by the batch, whether it had results or not.
+
+        """
+
+        if df is not None and not df.empty:
+            self.buffer.append(df)
+            self.buffered += df.shape[0]
+        self.keys.extend(keys or [])
+        if self.buffered >= self.flush_rows or len(self.keys) >= self.flush_keys:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered batches to a new part, the meta file is only updated once the
+        part is complete.
+
+        """
+
+        if not (self.buffer or self.keys) or self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        name = None
+        if self.buffer:
+            name = self._write_part(self.buffer)
+
+        self.meta['parts'].append({'name': name, 'rows': self.buffered, 'keys': self.keys})
+        self.meta['rows'] += self.buffered
+        self._write_meta()
+        self.buffer, self.buffered, self.keys = [], 0, []
+
+    def _write_part(self, frames) -> str:
+        name = 'part-{:05d}.tsv'.format(self.meta['next'])
+        self.meta['next'] += 1
+        tmp_path = os.path.join(self.path, name+'.tmp')
+        pd.concat(frames, ignore_index=True).to_csv(tmp_path, sep='\t', index=False)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        return name
+
+    def compact(self):
+        """Merges all parts, and their completed keys, into a single part.
+
+        The merged part is written under the next free part number and the meta file is
+        switched over to it before the old parts are removed, so an interruption leaves either
+        the old or the new layout intact.
+
+        """
+
+        self.flush()
+        parts = self.meta['parts']
+        if self.path is None or len(parts) < 2:
+            return
+        frames = list(self.frames())
+        name = self._write_part(frames) if frames else None
+        self.meta['parts'] = [{'name': name, 'rows': self.meta['rows'], 'keys': sorted(self.done)}]
+        self._write_meta()
+        for part in parts:
+            if part['name'] is not None:
+                os.remove(os.path.join(self.path, part['name']))
+
+    def frames(self):
+        """Yields the flushed parts, then the buffered batches, in the order they were appended.
+
+        """
+
+        for part in self.meta['parts']:
+            if part['name'] is None:
+                continue
+            yield pd.read_csv(os.path.join(self.path, part['name']), sep='\t')
+        yield from self.buffer
+
+    def frame(self) -> pd.DataFrame:
+        """Flushes the buffer and concatenates all parts into a single frame."""
+
+        self.flush()
+        frames = list(self.frames())
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def clear(self):
+        if self.path is not None and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        self.buffer, self.buffered, self.keys = [], 0, []
+        self.meta = {'rows': 0, 'next': 0, 'parts': []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
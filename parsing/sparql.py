@@ -0,0 +1,363 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ENDPOINTS = {
+    'dbpedia': 'http://dbpedia.org/sparql',
+    'wikidata': 'https://query.wikidata.org/sparql'
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+USER_AGENT = 'stocktwits.recommender/1.0 (SPARQL client)'
+BATCH_ERRORS = (urllib.error.URLError, TimeoutError, ConnectionError, ValueError)
+LITERAL_PATTERN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+
+def normalise_query(query: str) -> str:
+    """Collapses whitespace outside of string literals, so that queries differing only in
+    indentation share a cache entry.
+
+    """
+
+    parts = LITERAL_PATTERN.split(query)
+    return ''.join(p if i % 2 else re.sub(r'\s+', ' ', p) for i, p in enumerate(parts)).strip()
+
+class QueryCache:
+    """Content-addressed on-disk cache of SPARQL responses.
+
+    An entry is a JSON file named by the sha256 of the endpoint and the normalised query,
+    holding the response and the time it was fetched. Entries older than ttl are treated as
+    missing. A hit refreshes the modification time of its file, so that when the cache grows
+    beyond max_bytes the least recently used entries are evicted first. In offline mode
+    entries never expire and callers are expected to not query the endpoint on a miss.
+
+    Attributes:
+        path (str): Cache directory.
+        ttl (float): Seconds an entry stays valid, forever if None.
+        max_bytes (int): Size beyond which entries are evicted, unbounded if None.
+        offline (bool): Serve cached responses only.
+
+    """
+
+    def __init__(self, path, ttl: float=None, max_bytes: int=None, offline: bool=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits, self.misses = 0, 0
+        self._size = None
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(endpoint, query) -> str:
+        return hashlib.sha256('{}\n{}'.format(endpoint, normalise_query(query)).encode('utf-8')).hexdigest()
+
+    def _file(self, key) -> str:
+        return os.path.join(self.path, key[:2], key+'.json')
+
+    def get(self, endpoint, query):
+        """Returns the cached response, or None if there is no valid entry."""
+
+        fp = self._file(self.key(endpoint, query))
+        try:
+            with open(fp) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        if not self.offline and self.ttl is not None and time.time()-entry['time'] > self.ttl:
+            self.misses += 1
+            return None
+        os.utime(fp)
+        self.hits += 1
+        return entry['response']
+
+    def put(self, endpoint, query, response):
+        fp = self._file(self.key(endpoint, query))
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        tmp = fp+'.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'endpoint': endpoint, 'query': query, 'time': time.time(), 'response': response}, f)
+        os.replace(tmp, fp)
+
+        if self.max_bytes is not None:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += os.path.getsize(fp)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith('.json'):
+                    fp = os.path.join(directory, name)
+                    stat = os.stat(fp)
+                    entries.append((fp, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Removes least recently used entries until the cache is below 90% of max_bytes."""
+
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        for fp, entry_size, _ in entries:
+            if size <= 0.9*self.max_bytes:
+                break
+            os.remove(fp)
+            size -= entry_size
+        self._size = size
+
+class TokenBucket:
+    """Asyncio token bucket, allowing bursts of up to capacity requests and rate requests per
+    second on average.
+
+    """
+
+    def __init__(self, rate: float, capacity: int=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1-self.tokens)/self.rate)
+
+class BatchSizer:
+    """Additive-increase/multiplicative-decrease controller of the number of items per query.
+
+    A request answered well within the limits (latency under half of target_latency) grows
+    the batch size by step, a request which was slow, failed or returned max_results rows,
+    the cap at which endpoints silently truncate results, shrinks it by the decrease factor.
+    The size converges to the largest batches the endpoint answers within its limits, ie.
+    the fewest requests.
+
+    Attributes:
+        size (int): Current batch size.
+        minimum (int): Smallest batch size.
+        maximum (int): Largest batch size.
+        step (int): Additive increase.
+        decrease (float): Multiplicative decrease.
+        target_latency (float): Latency, in seconds, above which the size is decreased.
+        max_results (int): Result rows at which a response is assumed to be truncated.
+
+    """
+
+    def __init__(self, initial: int=16, minimum: int=1, maximum: int=1024, step: int=8, decrease: float=0.5, target_latency: float=10.0, max_results: int=10000):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.max_results = max_results
+
+    def observe(self, size: int, latency: float=None, results: int=None, failed: bool=False):
+        """Adapts the batch size to the outcome of a request for size items."""
+
+        if failed or (latency is not None and latency > self.target_latency) or (results is not None and results >= self.max_results):
+            self.size = max(self.minimum, int(min(self.size, size)*self.decrease))
+        elif latency is not None and latency < self.target_latency/2 and size >= self.size:
+            self.size = min(self.maximum, self.size+self.step)
+
+class AsyncSPARQL:
+    """Rate limited, concurrent SPARQL client.
+
+    Queries are POSTed with urllib in the default thread pool executor, so many of them can be
+    in flight at once while the event loop enforces the limits: a token bucket caps the request
+    rate and a semaphore the number of concurrent requests. Responses with a status in
+    RETRY_STATUS, and connection errors or timeouts, are retried with exponential backoff and
+    jitter, honouring a Retry-After header if the endpoint sends one.
+
+    Attributes:
+        endpoint (str): URL of the SPARQL endpoint, eg. ENDPOINTS['dbpedia'] or a local stub.
+        rate (float): Requests per second.
+        burst (int): Requests which may be sent at once before the rate applies.
+        concurrency (int): Maximum number of requests in flight.
+        retries (int): Retries of a failing request before its error is raised.
+        backoff (float): Base delay, in seconds, of the exponential backoff.
+        timeout (float): Timeout of a single request, in seconds.
+        cache (QueryCache): Consulted before, and filled after, every request. In offline mode
+            a miss returns None without querying the endpoint.
+        sizer (BatchSizer): Batch size controller of query_batched, kept per endpoint.
+
+    """
+
+    def __init__(self, endpoint: str, rate: float=5.0, burst: int=5, concurrency: int=4, retries: int=5, backoff: float=1.0, timeout: float=60, cache: QueryCache=None, sizer: BatchSizer=None):
+        self.endpoint = endpoint
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.sizer = sizer or BatchSizer()
+
+    def _request(self, query) -> dict:
+        data = urllib.parse.urlencode({'query': query, 'format': 'json'}).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=data, headers={
+            'Accept': 'application/sparql-results+json',
+            'User-Agent': USER_AGENT
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def _delay(self, attempt, error=None) -> float:
+        retry_after = error.headers.get('Retry-After') if isinstance(error, urllib.error.HTTPError) and error.headers else None
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff*2**attempt*(1+random.random())
+
+    async def _fetch(self, query, bucket, semaphore) -> tuple:
+        """Returns the response to query and the latency of the request which answered it, None
+        when it was answered from the cache.
+
+        """
+
+        if self.cache is not None:
+            response = self.cache.get(self.endpoint, query)
+            if response is not None or self.cache.offline:
+                return response, None
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries+1):
+            await bucket.acquire()
+            async with semaphore:
+                try:
+                    start = time.monotonic()
+                    response = await loop.run_in_executor(None, self._request, query)
+                    latency = time.monotonic()-start
+                    if self.cache is not None:
+                        self.cache.put(self.endpoint, query, response)
+                    return response, latency
+                except urllib.error.HTTPError as e:
+                    if e.code not in RETRY_STATUS or attempt == self.retries:
+                        raise
+                    error = e
+                except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                    if attempt == self.retries:
+                        raise
+                    error = e
+            delay = self._delay(attempt, error)
+            logging.warning("SPARQL request to {} failed ({}), retrying in {:.1f}s".format(self.endpoint, error, delay))
+            await asyncio.sleep(delay)
+
+    async def _query(self, query, bucket, semaphore, on_answer=None) -> dict:
+        response, _ = await self._fetch(query, bucket, semaphore)
+        if on_answer is not None:
+            on_answer(query, response)
+            return None
+        return response
+
+    async def query_all(self, queries, on_answer=None) -> list:
+        """Runs all queries concurrently within the limits.
+
+        Args:
+            queries (list): Queries to run.
+            on_answer (function): Called with (query, response) as soon as a query is answered,
+                the responses are then handed over instead of being collected.
+
+        Returns:
+            list: Decoded JSON response per query, in the order of queries, None for offline
+                cache misses (and for every query when on_answer is given).
+
+        """
+
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self._query(q, bucket, semaphore, on_answer) for q in queries])
+
+    def run_all(self, queries, on_answer=None) -> list:
+        return asyncio.run(self.query_all(list(queries), on_answer))
+
+    def run(self, query) -> dict:
+        return self.run_all([query])[0]
+
+    async def query_batched(self, items, build, sizer=None, on_answer=None) -> list:
+        """Queries items in batches sized by a BatchSizer from the observed responses.
+
+        Batches of the current size are sent in waves of self.concurrency. Every answered
+        request is reported to the sizer, which adapts the size of the next wave's batches.
+        Batches which fail after their retries, or whose results were probably truncated,
+        are split in half and queued again. A failing single item is logged and skipped.
+
+        Args:
+            items (list): Items to query, eg. the VALUES rows of a query.
+            build (function): Builds the query of a list of items.
+            sizer (BatchSizer): Defaults to the sizer of this client.
+            on_answer (function): Called with (batch, response) as soon as a batch is answered,
+                the responses are then handed over instead of being collected.
+
+        Returns:
+            list: (batch, response) per answered batch, not necessarily in the order of items,
+                empty when on_answer is given.
+
+        """
+
+        sizer = sizer or self.sizer
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        items = list(items)
+        requeued = collections.deque()
+        answered = []
+        pos = 0
+
+        while pos < len(items) or requeued:
+            wave = []
+            while len(wave) < self.concurrency and (requeued or pos < len(items)):
+                if requeued:
+                    wave.append(requeued.popleft())
+                else:
+                    wave.append(items[pos:pos+sizer.size])
+                    pos += len(wave[-1])
+
+            results = await asyncio.gather(*[self._fetch(build(b), bucket, semaphore) for b in wave], return_exceptions=True)
+            for batch, result in zip(wave, results):
+                if isinstance(result, BaseException):
+                    if not isinstance(result, BATCH_ERRORS):
+                        raise result
+                    sizer.observe(len(batch), failed=True)
+                    if len(batch) == 1:
+                        logging.error("SPARQL request to {} failed for {}: {}".format(self.endpoint, batch[0], result))
+                    else:
+                        requeued.extend([batch[:len(batch)//2], batch[len(batch)//2:]])
+                    continue
+
+                response, latency = result
+                rows = len(response['results']['bindings']) if response and 'results' in response else None
+                if latency is not None:
+                    sizer.observe(len(batch), latency, rows)
+                if rows is not None and rows >= sizer.max_results and len(batch) > 1:
+                    requeued.extend([batch[:len(batch)//2], batch[len(batch)//2:]])
+                    continue
+                if on_answer is not None:
+                    on_answer(batch, response)
+                else:
+                    answered.append((batch, response))
+            logging.info("Queried {}/{} items from {}, batch size {}".format(pos-sum(len(b) for b in requeued), len(items), self.endpoint, sizer.size))
+        return answered
+
+    def run_batched(self, items, build, sizer=None, on_answer=None) -> list:
+        return asyncio.run(self.query_batched(items, build, sizer, on_answer))
@@ -0,0 +1,142 @@
+import numpy as np
+
+import hashlib
+import json
+import os
+
+STRATEGIES = ['random', 'user', 'temporal']
+
+class Splitter:
+    """Splits the rows of a design matrix into train/(validation)/test row-index arrays.
+
+    Strategies:
+        random: Rows are shuffled and cut by the set sizes.
+        user: Users are shuffled and cut by the set sizes, so all positives and sampled
+            negatives of a user end up in the same set.
+        temporal: Rows are ordered by timestamp and cut at the quantiles given by the set
+            sizes, or at the explicit cutoff timestamps, so every set is later than the one
+            before it.
+
+    Only index arrays are computed, the matrices are sliced once per set at the end. The
+    indices are persisted to a .npz file together with a fingerprint of the rows and the
+    split parameters, and are reused as long as neither changes.
+
+    Attributes:
+        strategy (str): One of STRATEGIES.
+        test_size (float): Fraction of rows (users for the user strategy) in the test set.
+        validation_size (float): Fraction in the validation set, no validation set if 0.
+        seed (int): Seed of the shuffles.
+        cutoffs (tuple): Optional (validation, test) start timestamps of the temporal strategy,
+            with a single (test,) cutoff when there is no validation set.
+        path (str): Path of the persisted .npz file, the split is not persisted if None.
+
+    """
+
+    def __init__(self, strategy: str='random', test_size: float=0.2, validation_size: float=0.0, seed: int=1, cutoffs: tuple=None, path: str=None):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown split strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.test_size = test_size
+        self.validation_size = validation_size
+        self.seed = seed
+        self.cutoffs = cutoffs
+        self.path = path
+        if cutoffs is not None and len(cutoffs) != len(self.names)-1:
+            raise ValueError("Expected {} cutoffs for the sets {}, got {}".format(len(self.names)-1, self.names, len(cutoffs)))
+
+    @property
+    def names(self) -> list:
+        return ['train', 'validation', 'test'] if self.validation_size else ['train', 'test']
+
+    def _params(self) -> str:
+        return json.dumps({
+            'strategy': self.strategy,
+            'test_size': self.test_size,
+            'validation_size': self.validation_size,
+            'seed': self.seed,
+            'cutoffs': list(self.cutoffs) if self.cutoffs is not None else None
+        }, sort_keys=True)
+
+    @staticmethod
+    def fingerprint(*arrays) -> str:
+        sha1 = hashlib.sha1()
+        for a in arrays:
+            if a is not None:
+                sha1.update(np.ascontiguousarray(a).tobytes())
+        return sha1.hexdigest()
+
+    def _bounds(self, n) -> list:
+        """Cut points of the sets in an ordering of n items."""
+
+        sizes = [self.validation_size, self.test_size] if self.validation_size else [self.test_size]
+        bounds, end = [], n
+        for size in reversed(sizes):
+            end -= int(round(size*n))
+            bounds.insert(0, end)
+        return bounds
+
+    def _random(self, rows) -> list:
+        rng = np.random.default_rng(self.seed)
+        return np.split(rng.permutation(rows), self._bounds(rows))
+
+    def _user(self, users) -> list:
+        uniques, codes = np.unique(users, return_inverse=True)
+        codes = codes.reshape(-1)
+        rng = np.random.default_rng(self.seed)
+        order = rng.permutation(len(uniques))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.shape[0])
+
+        # set of each user by its position in the shuffled user order
+        user_set = np.searchsorted(self._bounds(len(uniques)), rank, side='right')
+        row_set = user_set[codes]
+        return [np.flatnonzero(row_set == i) for i in range(len(self.names))]
+
+    def _temporal(self, timestamps) -> list:
+        order = np.argsort(timestamps, kind='mergesort')
+        if self.cutoffs is None:
+            return np.split(order, self._bounds(order.shape[0]))
+        bounds = np.searchsorted(timestamps[order], self.cutoffs, side='left')
+        return np.split(order, bounds)
+
+    def split(self, rows: int, users=None, timestamps=None) -> dict:
+        """Computes, or loads the persisted, row indices of every set.
+
+        Args:
+            rows (int): Number of rows of the design matrix.
+            users (numpy.ndarray): User id per row, required by the user strategy.
+            timestamps (numpy.ndarray): Timestamp per row, required by the temporal strategy.
+
+        Returns:
+            dict: Set name to sorted numpy.ndarray of row indices.
+
+        """
+
+        fingerprint = self.fingerprint(np.array([rows]), users, timestamps)
+        if self.path is not None and os.path.exists(self.path):
+            with np.load(self.path) as f:
+                if str(f['fingerprint']) == fingerprint and str(f['params']) == self._params():
+                    return {name: f[name] for name in self.names}
+
+        if self.strategy == 'random':
+            sets = self._random(rows)
+        elif self.strategy == 'user':
+            sets = self._user(np.asarray(users))
+        else:
+            sets = self._temporal(np.asarray(timestamps))
+        indices = {name: np.sort(s) for name, s in zip(self.names, sets)}
+
+        if self.path is not None:
+            np.savez(self.path, fingerprint=fingerprint, params=self._params(), **indices)
+        return indices
+
+    @staticmethod
+    def take(indices, *matrices) -> list:
+        """Slices every matrix by the row indices of every set.
+
+        Returns:
+            list: One tuple of sliced matrices per set, in the order of indices.
+
+        """
+
+        return [tuple(m[idx] for m in matrices) for idx in indices.values()]
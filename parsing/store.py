@@ -0,0 +1,331 @@
+import numpy as np
+import pandas as pd
+
+import hashlib
+import json
+import os
+import shutil
+
+INTERACTION_COLUMNS = {
+    'user_id': 'int32',
+    'tag_id': 'int32',
+    'timestamp': 'int64'
+}
+CASHTAG_COLUMNS = ['tag_industry', 'tag_sector']
+CODE_DTYPE = 'int16'
+
+class InteractionStore:
+    """Columnar, dictionary-encoded on-disk store for user-cashtag interactions.
+
+    Each interaction column is kept as a raw, typed binary file which can be appended
+    to and memory-mapped on read. The cashtag attributes (industry and sector) are not
+    repeated per interaction, instead they live in a cashtag dimension table keyed by
+    tag_id and are stored as integer codes into a per-column dictionary.
+
+    Layout of a store directory:
+        meta.json: Row count, column dtypes and category dictionaries.
+        <column>.bin: One file per interaction column.
+        cashtags/<column>.bin: The cashtag dimension table.
+
+    Attributes:
+        path (str): Directory holding the store.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._meta_path = os.path.join(self.path, 'meta.json')
+        self._cashtag_path = os.path.join(self.path, 'cashtags')
+
+        self.meta = self._read_meta()
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                'rows': 0,
+                'columns': INTERACTION_COLUMNS,
+                'cashtags': 0,
+                'categories': {c: [] for c in CASHTAG_COLUMNS}
+            }
+
+    def _write_meta(self):
+        tmp_path = self._meta_path+'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self._meta_path)
+
+    @property
+    def rows(self) -> int:
+        return self.meta['rows']
+
+    def _column(self, path, dtype, count, mmap=True) -> np.ndarray:
+        if not count:
+            return np.empty(0, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+        return np.fromfile(path, dtype=dtype, count=count)
+
+    def _encode(self, column, values) -> np.ndarray:
+        """Maps category values to their dictionary codes, growing the dictionary with unseen values.
+
+        """
+
+        dictionary = self.meta['categories'][column]
+        lookup = {v: i for i, v in enumerate(dictionary)}
+        uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        for u in uniques:
+            if u not in lookup:
+                lookup[u] = len(dictionary)
+                dictionary.append(str(u))
+        codes = np.array([lookup[u] for u in uniques], dtype=CODE_DTYPE)
+        return codes[inverse.reshape(-1)]
+
+    def cashtags(self, decode=True) -> pd.DataFrame:
+        """Reads the cashtag dimension table.
+
+        Args:
+            decode (bool): Return industry/sector as pandas Categoricals rather than raw codes.
+
+        Returns:
+            pandas.DataFrame: One row per tag_id, sorted by tag_id.
+
+        """
+
+        count = self.meta['cashtags']
+        df = pd.DataFrame({
+            'tag_id': self._column(os.path.join(self._cashtag_path, 'tag_id.bin'), INTERACTION_COLUMNS['tag_id'], count, mmap=False)
+        })
+        for c in CASHTAG_COLUMNS:
+            codes = self._column(os.path.join(self._cashtag_path, c+'.bin'), CODE_DTYPE, count, mmap=False)
+            df[c] = pd.Categorical.from_codes(codes, self.meta['categories'][c]) if decode else codes
+        return df
+
+    def _write_cashtags(self, df):
+        os.makedirs(self._cashtag_path, exist_ok=True)
+        for c in ['tag_id']+CASHTAG_COLUMNS:
+            df[c].values.tofile(os.path.join(self._cashtag_path, c+'.bin'))
+        self.meta['cashtags'] = df.shape[0]
+
+    def append(self, df):
+        """Appends interactions to the store.
+
+        Interaction columns are appended to their column files, while the cashtag
+        attributes are dictionary encoded and merged into the dimension table, newer
+        attributes for an already known tag_id taking precedence.
+
+        Args:
+            df (pandas.DataFrame): Frame with columns user_id, tag_id, timestamp, tag_industry, tag_sector.
+
+        Returns:
+            tuple: (start, stop), the range of store rows taken by the appended interactions.
+
+        """
+
+        start = self.rows
+        os.makedirs(self.path, exist_ok=True)
+        for c, dtype in INTERACTION_COLUMNS.items():
+            with open(os.path.join(self.path, c+'.bin'), 'ab') as f:
+                # drop the bytes of an append which was interrupted before the meta was written
+                f.truncate(start*np.dtype(dtype).itemsize)
+                df[c].values.astype(dtype).tofile(f)
+
+        cashtags = df[['tag_id']+CASHTAG_COLUMNS].drop_duplicates(subset='tag_id', keep='last')
+        cashtags = pd.DataFrame({
+            'tag_id': cashtags['tag_id'].values.astype(INTERACTION_COLUMNS['tag_id']),
+            **{c: self._encode(c, cashtags[c].values) for c in CASHTAG_COLUMNS}
+        })
+        cashtags = pd.concat([self.cashtags(decode=False), cashtags], ignore_index=True)
+        cashtags = cashtags.drop_duplicates(subset='tag_id', keep='last').sort_values('tag_id')
+        self._write_cashtags(cashtags)
+
+        self.meta['rows'] += df.shape[0]
+        self._write_meta()
+        return (start, self.rows)
+
+    def delete_rows(self, start, stop):
+        """Removes the interactions in the row range [start, stop), shifting later rows down.
+
+        """
+
+        for c, dtype in INTERACTION_COLUMNS.items():
+            path = os.path.join(self.path, c+'.bin')
+            values = np.fromfile(path, dtype=dtype, count=self.rows)
+            np.delete(values, np.s_[start:stop]).tofile(path)
+        self.meta['rows'] -= stop-start
+        self._write_meta()
+
+    def write(self, df):
+        """Replaces the contents of the store with the given interactions.
+
+        """
+
+        self.clear()
+        self.append(df)
+
+    def clear(self):
+        for c in INTERACTION_COLUMNS:
+            path = os.path.join(self.path, c+'.bin')
+            if os.path.isfile(path):
+                os.remove(path)
+        if os.path.isdir(self._cashtag_path):
+            shutil.rmtree(self._cashtag_path)
+        self.meta = {
+            'rows': 0,
+            'columns': INTERACTION_COLUMNS,
+            'cashtags': 0,
+            'categories': {c: [] for c in CASHTAG_COLUMNS}
+        }
+
+    def read(self, columns=None, decode=True, mmap=True) -> pd.DataFrame:
+        """Reads the requested columns of the interactions.
+
+        Only the files backing the requested columns are touched. Cashtag attributes are
+        joined in from the dimension table by tag_id.
+
+        Args:
+            columns (list): Columns to read, defaults to all interaction and cashtag columns.
+            decode (bool): Return industry/sector as pandas Categoricals rather than raw codes.
+            mmap (bool): Memory-map the column files instead of reading them into memory.
+
+        Returns:
+            pandas.DataFrame: The projected interactions.
+
+        """
+
+        columns = columns or list(INTERACTION_COLUMNS)+CASHTAG_COLUMNS
+        data = {}
+        for c in columns:
+            if c in INTERACTION_COLUMNS:
+                data[c] = self._column(os.path.join(self.path, c+'.bin'), INTERACTION_COLUMNS[c], self.rows, mmap)
+            elif c not in CASHTAG_COLUMNS:
+                raise KeyError("Unknown column: {}".format(c))
+
+        if any(c in CASHTAG_COLUMNS for c in columns):
+            tag_ids = data['tag_id'] if 'tag_id' in data else self._column(os.path.join(self.path, 'tag_id.bin'), INTERACTION_COLUMNS['tag_id'], self.rows, mmap)
+            cashtags = self.cashtags(decode=False)
+            positions = np.searchsorted(cashtags['tag_id'].values, tag_ids)
+            for c in CASHTAG_COLUMNS:
+                if c not in columns:
+                    continue
+                codes = cashtags[c].values[positions]
+                data[c] = pd.Categorical.from_codes(codes, self.meta['categories'][c]) if decode else codes
+
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+class Manifest:
+    """Record of the source files that have been ingested into an InteractionStore.
+
+    For every file the size, modification time and SHA-1 of its contents are kept,
+    together with the range of store rows it produced, so that new files can be
+    appended and changed files replaced without rebuilding the store.
+
+    Attributes:
+        store (InteractionStore): The store the files were ingested into.
+        files (dict): Maps file name to its fingerprint and row range.
+
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = os.path.join(store.path, 'manifest.json')
+        self.files = self._read()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self):
+        os.makedirs(self.store.path, exist_ok=True)
+        tmp_path = self.path+'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.files, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def digest(path, chunk_size=1 << 20) -> str:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def status(self, name, path) -> str:
+        """Compares a source file against its manifest entry.
+
+        The size and modification time are checked first, the contents are only
+        hashed when those differ.
+
+        Returns:
+            str: One of 'new', 'changed' or 'unchanged'.
+
+        """
+
+        entry = self.files.get(name)
+        if not entry:
+            return 'new'
+        stat = os.stat(path)
+        if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return 'unchanged'
+        if stat.st_size == entry['size'] and self.digest(path) == entry['sha1']:
+            # touched but identical, record the new mtime so it is not hashed again
+            entry['mtime'] = stat.st_mtime
+            self.save()
+            return 'unchanged'
+        return 'changed'
+
+    def pending(self, directory, names) -> list:
+        """Returns the files which are new or have changed since they were last ingested.
+
+        """
+
+        return [n for n in names if self.status(n, os.path.join(directory, n)) != 'unchanged']
+
+    def add(self, name, path, rows, bots: str=None):
+        """Records an ingested file.
+
+        Args:
+            name (str): File name.
+            path (str): Path of the file.
+            rows (tuple): (start, stop) range of the store rows the file produced.
+            bots (str): Path of the file's BotScorer summary.
+
+        """
+
+        stat = os.stat(path)
+        self.files[name] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha1': self.digest(path),
+            'rows': list(rows),
+            'bots': bots
+        }
+        self.save()
+
+    def remove(self, name):
+        """Removes a file and the interactions it produced from the store.
+
+        """
+
+        entry = self.files.pop(name, None)
+        if not entry:
+            return
+        start, stop = entry['rows']
+        self.store.delete_rows(start, stop)
+        for e in self.files.values():
+            if e['rows'][0] >= stop:
+                e['rows'] = [e['rows'][0]-(stop-start), e['rows'][1]-(stop-start)]
+        self.save()
+
+    def clear(self):
+        self.files = {}
+        if os.path.isfile(self.path):
+            os.remove(self.path)
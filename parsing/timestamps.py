@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+STOCKTWITS_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def to_epoch(values, fmt: str=STOCKTWITS_FORMAT) -> np.ndarray:
+    """Converts a batch of StockTwits UTC timestamps to UNIX epoch seconds.
+
+    The whole column (or chunk of one) is parsed in a single vectorised call and is
+    always interpreted as UTC, independent of the timezone of the machine.
+
+    Args:
+        values (iterable): Timestamp strings, eg. a pandas.Series of 'created_at' values.
+        fmt (str): strptime-style format of the timestamps.
+
+    Returns:
+        numpy.ndarray: int64 array of UNIX timestamps.
+
+    Examples:
+        >>> to_epoch(['2017-02-01T19:16:54Z'])
+            array([1485976614])
+
+    """
+
+    stamps = pd.to_datetime(pd.Series(values, copy=False), format=fmt, utc=True)
+    return stamps.dt.tz_localize(None).values.astype('datetime64[s]').astype(np.int64)
@@ -0,0 +1,130 @@
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.parse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsing'))
+from sparql import AsyncSPARQL, QueryCache
+
+class StubEndpoint:
+    """Local SPARQL endpoint answering POSTed queries with a scripted status per request.
+
+    Every request pops the next (status, headers) of the script, once the script is exhausted
+    requests are answered with 200 and a single binding holding the query. The queries, arrival
+    times and the peak number of requests in flight are recorded.
+
+    """
+
+    def __init__(self, delay: float=0.0):
+        self.delay = delay
+        self.script = []
+        self.queries = []
+        self.times = []
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+        stub = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+                query = urllib.parse.parse_qs(body)['query'][0]
+                with stub._lock:
+                    stub.queries.append(query)
+                    stub.times.append(time.monotonic())
+                    stub.in_flight += 1
+                    stub.peak = max(stub.peak, stub.in_flight)
+                    status, headers = stub.script.pop(0) if stub.script else (200, {})
+                time.sleep(stub.delay)
+                payload = json.dumps({'results': {'bindings': [{'query': {'value': query}}]}}).encode('utf-8')
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Type', 'application/sparql-results+json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with stub._lock:
+                    stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/sparql'.format(self.server.server_address[1])
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class AsyncSPARQLTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubEndpoint()
+
+    def tearDown(self):
+        self.stub.close()
+
+    def client(self, **kwargs):
+        params = dict(rate=1000, burst=1000, backoff=0.01, timeout=5)
+        params.update(kwargs)
+        return AsyncSPARQL(self.stub.url, **params)
+
+    def test_retries_429_honouring_retry_after(self):
+        self.stub.script = [(429, {'Retry-After': '0.3'}), (429, {'Retry-After': '0.3'})]
+        start = time.monotonic()
+        response = self.client().run('SELECT 1')
+        self.assertEqual(response['results']['bindings'][0]['query']['value'], 'SELECT 1')
+        self.assertEqual(len(self.stub.queries), 3)
+        self.assertGreaterEqual(time.monotonic()-start, 0.6)
+
+    def test_retries_5xx_with_backoff(self):
+        self.stub.script = [(503, {}), (500, {})]
+        self.assertIsNotNone(self.client().run('SELECT 1'))
+        self.assertEqual(len(self.stub.queries), 3)
+
+    def test_gives_up_after_retries(self):
+        self.stub.script = [(503, {})]*3
+        with self.assertRaises(urllib.error.HTTPError):
+            self.client(retries=2).run('SELECT 1')
+        self.assertEqual(len(self.stub.queries), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.stub.script = [(400, {})]
+        with self.assertRaises(urllib.error.HTTPError):
+            self.client().run('SELECT 1')
+        self.assertEqual(len(self.stub.queries), 1)
+
+    def test_rate_limit(self):
+        self.client(rate=20, burst=1).run_all(['SELECT {}'.format(i) for i in range(6)])
+        # one token up front, the other five at 20 per second
+        self.assertGreaterEqual(self.stub.times[-1]-self.stub.times[0], 0.2)
+
+    def test_concurrency_limit(self):
+        self.stub.delay = 0.05
+        responses = self.client(concurrency=2).run_all(['SELECT {}'.format(i) for i in range(8)])
+        self.assertEqual([r['results']['bindings'][0]['query']['value'] for r in responses], ['SELECT {}'.format(i) for i in range(8)])
+        self.assertLessEqual(self.stub.peak, 2)
+
+    def test_cache_and_offline(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = QueryCache(path)
+            first = self.client(cache=cache).run('SELECT  1')
+            # whitespace outside literals does not make a new entry
+            self.assertEqual(self.client(cache=cache).run('SELECT 1'), first)
+            self.assertEqual(len(self.stub.queries), 1)
+
+            offline = QueryCache(path, offline=True)
+            self.assertEqual(self.client(cache=offline).run('SELECT 1'), first)
+            self.assertIsNone(self.client(cache=offline).run('SELECT 2'))
+            self.assertEqual(len(self.stub.queries), 1)
+
+if __name__ == '__main__':
+    unittest.main()